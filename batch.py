@@ -0,0 +1,112 @@
+import argparse
+import csv
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from diagnostics import json_safe
+from engine import read_model_file, read_data_file, fit_formula
+from report import write_report, write_report_set
+
+# Command line tool to fit one model to many data files at once, without opening the GUI
+# Example:
+#   python batch.py models/Langmuir.txt "data/*.csv" --output results.csv --report report.html
+
+
+# Function to fit the model to a single data file, it runs inside a worker process
+# Errors are returned with the result, so one bad file does not stop the whole batch
+def fit_file(job):
+    formula, param_names, params, file_path = job
+    result = {"file": file_path, "error": ""}
+    try:
+        x, y, x_label, y_label = read_data_file(file_path)
+        fitted = fit_formula(formula, param_names, params, x, y)
+        fitted["x_label"] = x_label
+        fitted["y_label"] = y_label
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    fitted.pop("pcov")
+    result.update(fitted)
+    return result
+
+
+# Function to expand the glob patterns into a list of files, keeping the order and skipping duplicates
+def expand_patterns(patterns):
+    file_paths = []
+    for pattern in patterns:
+        for file_path in sorted(glob.glob(pattern)):
+            if file_path not in file_paths:
+                file_paths.append(file_path)
+    return file_paths
+
+
+# Function to fit the model to every data file, using a pool of worker processes
+def fit_files(model_path, patterns, workers=None):
+    formula, param_names, params = read_model_file(model_path)
+    jobs = [(formula, param_names, params, file_path) for file_path in expand_patterns(patterns)]
+    if not jobs:
+        return []
+
+    # Hand the jobs out in chunks, the fits are small so this keeps the overhead low
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fit_file, jobs, chunksize=chunksize))
+
+
+# Function to write the results to a csv file, one row per data file and one column per parameter
+def write_csv(results, file_path):
+    param_names = []
+    for result in results:
+        for name in result.get("param_names", []):
+            if name not in param_names:
+                param_names.append(name)
+
+    # The number of points is written as "points", so it can not clash with a parameter called n
+    columns = ["file", "error", "r_squared", "adj_r_squared", "std_err", "p_value", "sse", "rmse", "aic", "bic", "n"]
+    with open(file_path, "w", newline="", encoding="UTF-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns[:-1] + ["points"] + param_names)
+        for result in results:
+            values = dict(zip(result.get("param_names", []), result.get("params", [])))
+            row = [result.get(column, "") for column in columns]
+            row += [values.get(name, "") for name in param_names]
+            writer.writerow(row)
+
+
+# Function to write the results to a json file, undefined statistics are written as null
+def write_json(results, file_path):
+    with open(file_path, "w", encoding="UTF-8") as file:
+        json.dump(json_safe(results), file, indent=2, allow_nan=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit a model to many data files in parallel")
+    parser.add_argument("model", help="model file, for example models/Langmuir.txt")
+    parser.add_argument("data", nargs="+", help="data files or glob patterns, for example \"data/*.csv\"")
+    parser.add_argument("-o", "--output", default="results.csv", help="output file, .csv or .json")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--report", default=None, help="also write one html report with every fit")
+    parser.add_argument("--report-dir", default=None, help="also write a folder with an index.html and one report per fit")
+    args = parser.parse_args(argv)
+
+    results = fit_files(args.model, args.data, args.workers)
+
+    if args.output.lower().endswith(".json"):
+        write_json(results, args.output)
+    else:
+        write_csv(results, args.output)
+
+    if args.report:
+        write_report(results, args.report, workers=args.workers)
+    if args.report_dir:
+        write_report_set(results, args.report_dir, workers=args.workers)
+
+    failed = sum(1 for result in results if result["error"])
+    print("Fitted {} files, {} failed, results written to {}".format(len(results) - failed, failed, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+import numpy as np
+import scipy
+from scipy.optimize import OptimizeWarning
+from engine import read_model_file, fit
+from functions import calculate_statistics, bruteforce_fit
+from model_compiler import compile_model, compile_jacobian, clear_model_cache
+from multistart import sample_starts
+from plotting import decimate
+from report import render_plot, write_report
+
+# Command line tool to time every stage of the fitting pipeline on synthetic data
+# The data is generated from the shipped model files and a few harder models with more parameters,
+# at sizes from 6 points, like example.csv, up to a million. The timings can be saved as a json
+# baseline, and later runs compared against it, so a slower fit shows up as a failed comparison.
+# Every run also times a fixed reference workload that does not use the code of the repository, and
+# the baseline is scaled by how much faster or slower it ran, so a baseline made on another computer,
+# or on a busy one, still catches a stage that got slower compared to the others.
+# Example:
+#   python benchmark.py --save benchmarks/baseline.json
+#   python benchmark.py --compare benchmarks/baseline.json
+
+# The data sets, from the size of example.csv up to a million points
+SIZES = [6, 100, 10_000, 1_000_000]
+
+# The brute force search fits every start to all the points, so it is only timed up to this size
+BRUTEFORCE_MAX_POINTS = 10_000
+
+# The stages that are timed, in the order they run
+STAGES = ["compile", "curve_fit", "statistics", "bruteforce", "plot", "report"]
+
+# The most time importing main.py may take in seconds, the window can not appear before it is done
+IMPORT_BUDGET = 0.3
+
+# The modules whose import is timed, main.py for the start of the GUI and the modules the first fit and
+# the first plot import
+STARTUP_MODULES = ["main", "engine", "plotting"]
+
+# The harder models, with their parameters, the true values and the range of x
+# The shipped model files are read from the models folder, see benchmark_models. FreundlichZero starts
+# at x = 0, like an isotherm with a blank, where the jacobian of x**(1/n) has log(0) in it.
+EXTRA_MODELS = {
+    "FreundlichZero": ("Kf*x**(1/n)", ["Kf", "n"], [2.5, 1.6], (0, 1000)),
+    "Sips": ("Qmax*(Ks*x)^n/(1+(Ks*x)^n)", ["Qmax", "Ks", "n"], [500, 0.005, 0.8], (1, 1000)),
+    "DoubleExp": ("a*exp(-b*x) + c*exp(-d*x)", ["a", "b", "c", "d"], [10, 1.5, 4, 0.2], (0, 10)),
+    "Peak": ("a*exp(-((x - b)/c)^2/2) + d*x + f", ["a", "b", "c", "d", "f"], [5, 4, 0.8, 0.3, 1], (0, 10)),
+}
+
+# The true parameters and the range of x of the shipped model files
+SHIPPED_MODELS = {
+    "Langmuir": ([560, 0.0023], (1, 1000)),
+    "Freundlich": ([2.5, 1.6], (1, 1000)),
+}
+
+
+# Function to get every benchmark model as (name, formula, param_names, start, true_params, x_range)
+# The shipped models start from the values in their model files, the others from the true values scaled
+# by 1.3, so every fit has some work to do
+def benchmark_models(model_dir="models"):
+    models = []
+    for name, (true_params, x_range) in SHIPPED_MODELS.items():
+        formula, param_names, start = read_model_file(os.path.join(model_dir, name + ".txt"))
+        models.append((name, formula, param_names, start, true_params, x_range))
+    for name, (formula, param_names, true_params, x_range) in EXTRA_MODELS.items():
+        models.append((name, formula, param_names, [value * 1.3 for value in true_params], true_params, x_range))
+    return models
+
+
+# Function to make a synthetic data set from a model, with 2 % normal noise
+# The seed is fixed, so every run fits exactly the same data
+def synthetic_data(formula, param_names, true_params, x_range, n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.linspace(x_range[0], x_range[1], n)
+    y = compile_model(formula, param_names)(x, *true_params)
+    y = y + rng.normal(0, 0.02, n) * np.maximum(np.abs(y), 1e-3)
+    return x, y
+
+
+# Function to time a function, it is run repeat times and the fastest run is kept
+# The fastest run is the one least disturbed by the rest of the computer, so it is the most repeatable
+def best_time(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Function to time every stage for one model and one data size, it returns {stage: seconds}
+def benchmark_case(formula, param_names, start, x, y, repeat, cache_dir, starts=32):
+    timings = {}
+
+    def compile_stage():
+        clear_model_cache()
+        compile_model(formula, param_names)
+        compile_jacobian(formula, param_names)
+    timings["compile"] = best_time(compile_stage, repeat)
+
+    model = compile_model(formula, param_names)
+    jac = compile_jacobian(formula, param_names)
+    result = fit(model, x, y, start, param_names, jac)
+    timings["curve_fit"] = best_time(lambda: fit(model, x, y, start, param_names, jac), repeat)
+
+    y_fit = model(x, *result["params"])
+    timings["statistics"] = best_time(lambda: calculate_statistics(y, y_fit), repeat)
+
+    # The starting points are seeded, the search stops early once it stops improving, so with other
+    # starting points it would fit a different number of them on every run
+    if len(x) <= BRUTEFORCE_MAX_POINTS:
+        timings["bruteforce"] = best_time(lambda: bruteforce_fit(formula, param_names, x, y, start, starts=starts, workers=1, seed=0),
+                                          min(repeat, 3))
+
+    def plot_stage():
+        x_plot, y_plot = decimate(x, y)
+        render_plot(dict(result, formula=formula), x_plot, y_plot)
+    timings["plot"] = best_time(plot_stage, min(repeat, 3))
+
+    # Every report is drawn into an empty cache, so the time includes drawing the plot
+    report_result = dict(result, formula=formula, x=x, y=y, x_label="x", y_label="y")
+
+    def report_stage():
+        with tempfile.TemporaryDirectory(dir=cache_dir) as directory:
+            write_report([report_result], os.path.join(directory, "report.html"), cache_dir=directory, workers=1)
+    timings["report"] = best_time(report_stage, min(repeat, 3))
+    return timings
+
+
+# Function to run the whole benchmark, it returns the timings as {"model/points": {stage: seconds}}
+def run_benchmarks(sizes=SIZES, models=None, repeat=5, starts=32, model_dir="models", verbose=True):
+    results = {}
+    # Import the modules the stages only import when they first need them, so the first case is not
+    # timed with the imports, see startup_benchmarks for those
+    sample_starts([0.0], [1.0], 1)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, formula, param_names, start, true_params, x_range in benchmark_models(model_dir):
+            if models and name not in models:
+                continue
+            for n in sizes:
+                x, y = synthetic_data(formula, param_names, true_params, x_range, n)
+                # Big data sets take long enough to time them once
+                case_repeat = repeat if n <= 10_000 else 1
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", OptimizeWarning)
+                    timings = benchmark_case(formula, param_names, start, x, y, case_repeat, cache_dir, starts)
+                key = "{}/{}".format(name, n)
+                results[key] = timings
+                if verbose:
+                    print("{:<22}".format(key) + "".join(
+                        "{:>12}".format(format_time(timings[stage]) if stage in timings else "-") for stage in STAGES))
+    return results
+
+
+# Function to time the import of a module in a new python process, the fastest of repeat runs is kept
+def import_time(module_name, repeat=3):
+    code = "import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)".format(module_name)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=directory)
+        times.append(float(output.stdout))
+    return min(times)
+
+
+# Function to time the imports of the startup modules, as {"startup/module": {"import": seconds}}
+def startup_benchmarks(modules=STARTUP_MODULES, verbose=True):
+    results = {}
+    for module_name in modules:
+        results["startup/" + module_name] = {"import": import_time(module_name)}
+        if verbose:
+            print("{:<22}{:>12}".format("startup/" + module_name, format_time(results["startup/" + module_name]["import"])))
+    return results
+
+
+# Function to time a fixed workload of python and numpy that does not depend on the code being measured
+# Comparisons scale the baseline by it, so the speed of the computer cancels out
+def reference_time(repeat=5):
+    data = np.random.default_rng(0).random(200_000)
+
+    def workload():
+        sum(i * i for i in range(200_000))
+        np.sort(data)
+        np.exp(data).sum()
+    return best_time(workload, repeat)
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return "{:.1f} us".format(seconds * 1e6)
+    if seconds < 1:
+        return "{:.2f} ms".format(seconds * 1e3)
+    return "{:.2f} s".format(seconds)
+
+
+# Function to describe the computer the benchmark ran on, timings are only comparable on the same one
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+    }
+
+
+def save_baseline(file_path, results):
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(file_path, "w") as file:
+        json.dump({"machine": machine_info(), "timings": results}, file, indent=2)
+
+
+# Function to get how many times as long the reference workload took as in the baseline, 1 if either has none
+def reference_scale(results, baseline):
+    new = results.get("reference", {}).get("workload")
+    old = baseline["timings"].get("reference", {}).get("workload")
+    if not new or not old:
+        return 1.0
+    return new / old
+
+
+# Function to compare timings with a baseline, it returns the list of stages that got slower
+# The baseline is first scaled by the reference workload, see reference_scale. A stage only counts as
+# slower if it takes tolerance times as long as the scaled baseline, and at least min_seconds longer,
+# so the noise of the fastest stages does not fail the comparison
+def compare_baseline(results, baseline, tolerance=1.5, min_seconds=0.002):
+    scale = reference_scale(results, baseline)
+    regressions = []
+    for key, timings in results.items():
+        if key == "reference":
+            continue
+        for stage, seconds in timings.items():
+            old = baseline["timings"].get(key, {}).get(stage)
+            if old is None:
+                continue
+            old *= scale
+            if seconds > old * tolerance and seconds - old > min_seconds:
+                regressions.append((key, stage, old, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every stage of the fitting pipeline on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="number of data points of each data set")
+    parser.add_argument("--models", nargs="+", help="only benchmark these models, for example Langmuir Peak")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times the fast stages are timed, the fastest run is kept")
+    parser.add_argument("--starts", type=int, default=32, help="number of starting points of the brute force search")
+    parser.add_argument("--save", help="json file to save the timings to as a baseline")
+    parser.add_argument("--compare", help="json baseline to compare the timings with, exits with an error if a stage got slower")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="how many times slower than the baseline a stage may be")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET, help="most seconds importing main.py may take")
+    args = parser.parse_args()
+
+    results = {"reference": {"workload": reference_time(args.repeat)}}
+    print("{:<22}{:>12}".format("reference", format_time(results["reference"]["workload"])))
+    print("{:<22}".format("model/points") + "".join("{:>12}".format(stage) for stage in STAGES))
+    results.update(run_benchmarks(args.sizes, args.models, args.repeat, args.starts))
+    print("{:<22}{:>12}".format("module", "import"))
+    results.update(startup_benchmarks())
+
+    if args.save:
+        save_baseline(args.save, results)
+        print("Baseline written to {}".format(args.save))
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline.get("machine") != machine_info():
+            print("Warning: the baseline was made on a different computer or with different versions")
+        print("The reference workload took {:.2f}x as long as in the baseline, the baseline is scaled by it".format(
+            reference_scale(results, baseline)))
+        regressions = compare_baseline(results, baseline, args.tolerance)
+        for key, stage, old, new in regressions:
+            print("Slower: {} {} {} -> {} ({:.1f}x)".format(key, stage, format_time(old), format_time(new), new / old))
+        if regressions:
+            sys.exit(1)
+        print("No stage is more than {}x slower than the baseline".format(args.tolerance))
+
+    # The start of the GUI has a fixed budget, whatever the baseline says
+    main_import = results["startup/main"]["import"]
+    if main_import > args.import_budget:
+        print("Importing main.py took {}, over the budget of {}".format(format_time(main_import), format_time(args.import_budget)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
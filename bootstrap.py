@@ -0,0 +1,162 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from scipy.optimize import curve_fit
+from diagnostics import stage
+from model_compiler import compile_model, compile_jacobian
+
+# Bootstrap confidence intervals of the fitted parameters
+# The data is resampled thousands of times and the model is fitted again to every resampled data set,
+# the spread of the refitted parameters gives their confidence intervals. All the resamples are drawn
+# at once as one array of indices, and the refits run on a pool of worker processes in chunks, every
+# refit starting from the parameters of the original fit, so it only has a short way to go.
+#
+# Two kinds of resampling:
+#   residual - the fitted curve plus resampled residuals, x stays the same, best for designed experiments
+#   pairs    - resampled (x, y) points, it makes no assumption about the errors
+# The search stops at the time budget, the intervals are then computed from the refits that finished.
+
+METHODS = ["residual", "pairs"]
+
+# The number of resamples sent to a worker at once
+CHUNK = 64
+
+
+# The state of a worker process, set once when the worker starts
+_worker = {}
+
+
+def _init_worker(formula, param_names, x, y, y_fit, residuals, params, method):
+    _worker["model"] = compile_model(formula, param_names)
+    _worker["jac"] = compile_jacobian(formula, param_names)
+    _worker.update(x=x, y=y, y_fit=y_fit, residuals=residuals, params=params, method=method)
+
+
+# Function to refit the model to the resampled data sets of a chunk of index rows, it runs in a worker
+# Refits that fail are nan, refits after the deadline are not started and not returned
+def _fit_resamples(job):
+    indices, deadline = job
+    model, jac, params = _worker["model"], _worker["jac"], _worker["params"]
+    x, y_fit, residuals = _worker["x"], _worker["y_fit"], _worker["residuals"]
+
+    # Build the resampled data sets of the whole chunk at once
+    if _worker["method"] == "pairs":
+        xs, ys = x[indices], _worker["y"][indices]
+    else:
+        xs, ys = np.broadcast_to(x, indices.shape), y_fit + residuals[indices]
+
+    fitted = []
+    for x_resample, y_resample in zip(xs, ys):
+        if time.time() > deadline:
+            break
+        try:
+            with np.errstate(all="ignore"):
+                popt, _ = curve_fit(model, x_resample, y_resample, p0=params, jac=jac)
+        except Exception:
+            popt = np.full(len(params), np.nan)
+        fitted.append(popt)
+    return np.array(fitted).reshape(len(fitted), len(params))
+
+
+# Function to draw the indices of every resample at once, one row per resample
+# Pairs resamples with fewer distinct points than parameters can not be fitted, they are drawn again
+def resample_indices(n, resamples, k, method, rng):
+    indices = rng.integers(0, n, size=(resamples, n))
+    if method == "pairs":
+        for _ in range(10):
+            distinct = np.sort(indices, axis=1)
+            distinct = 1 + np.count_nonzero(np.diff(distinct, axis=1), axis=1)
+            bad = distinct <= k
+            if not bad.any():
+                break
+            indices[bad] = rng.integers(0, n, size=(int(bad.sum()), n))
+    return indices
+
+
+# Function to get the bootstrap confidence intervals of the parameters of a fit
+# params are the fitted parameters, every refit starts from them. It returns a dictionary with the
+# lower and upper limits and the standard error of every parameter, and how many refits were made.
+# callback is called with the number of refits done after every chunk, it can raise to stop the search.
+def bootstrap_fit(formula, param_names, x, y, params, resamples=2000, method="residual", confidence=0.95,
+                  time_budget=3.0, workers=None, seed=None, record=None, callback=None):
+    if method not in METHODS:
+        raise ValueError("Unknown resampling method: {}".format(method))
+    start = time.perf_counter()
+    deadline = time.time() + time_budget
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    params = np.asarray(params, dtype=float)
+    n, k = len(x), len(params)
+    if n <= k:
+        raise ValueError("There are {} points for {} parameters".format(n, k))
+
+    # The residuals are scaled up, they are a bit smaller than the real errors because the fit used them
+    model = compile_model(formula, param_names)
+    y_fit = model(x, *params)
+    residuals = (y - y_fit) * np.sqrt(n / (n - k))
+    residuals -= residuals.mean()
+
+    with stage(record, "resample"):
+        indices = resample_indices(n, resamples, k, method, np.random.default_rng(seed))
+    chunks = [indices[i:i + CHUNK] for i in range(0, resamples, CHUNK)]
+
+    fitted = []
+    done = 0
+    workers = min(len(chunks), workers or os.cpu_count() or 1)
+    with stage(record, "refit"):
+        if workers <= 1:
+            _init_worker(formula, tuple(param_names), x, y, y_fit, residuals, params, method)
+            for chunk in chunks:
+                fitted.append(_fit_resamples((chunk, deadline)))
+                done += len(fitted[-1])
+                if callback is not None:
+                    callback(fitted=done, resamples=resamples)
+                if time.time() > deadline:
+                    break
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(formula, tuple(param_names), x, y, y_fit, residuals, params, method))
+            try:
+                # Keep two chunks per worker in flight, so the search can stop soon after the deadline
+                pending = set()
+                next_chunk = 0
+                while next_chunk < len(chunks) or pending:
+                    while next_chunk < len(chunks) and len(pending) < workers * 2 and time.time() < deadline:
+                        pending.add(executor.submit(_fit_resamples, (chunks[next_chunk], deadline)))
+                        next_chunk += 1
+                    if not pending:
+                        break
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        fitted.append(future.result())
+                        done += len(fitted[-1])
+                    if callback is not None:
+                        callback(fitted=done, resamples=resamples)
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    with stage(record, "intervals"):
+        fitted = np.vstack(fitted) if fitted else np.empty((0, k))
+        converged = fitted[np.all(np.isfinite(fitted), axis=1)]
+        if len(converged) < 2:
+            raise RuntimeError("Only {} of {} refits converged".format(len(converged), len(fitted)))
+        alpha = (1 - confidence) / 2
+        lower, upper = np.percentile(converged, [100 * alpha, 100 * (1 - alpha)], axis=0)
+        std_err = converged.std(axis=0, ddof=1)
+
+    if record is not None:
+        record.set(n=n, resamples=resamples, refits=len(fitted), failed=len(fitted) - len(converged))
+    return {
+        "method": method,
+        "confidence": confidence,
+        "param_names": list(param_names),
+        "params": [float(value) for value in params],
+        "lower": [float(value) for value in lower],
+        "upper": [float(value) for value in upper],
+        "std_err": [float(value) for value in std_err],
+        "resamples": resamples,
+        "refits": len(fitted),
+        "failed": len(fitted) - len(converged),
+        "time": time.perf_counter() - start,
+    }
@@ -0,0 +1,133 @@
+import argparse
+import glob
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from engine import read_model_file, read_data_file, fit_params, make_result, coarse_to_fine_params, LARGE_DATA_POINTS
+from fit_statistics import compute_fit_statistics
+from model_compiler import compile_model, compile_jacobian
+
+# Fits every model in the models folder to the same data at once and ranks them
+# Example:
+#   python compare.py example.csv
+
+
+# Function to get the models folder, next to this file or else in the current folder
+def default_model_dir():
+    model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    if os.path.isdir(model_dir):
+        return model_dir
+    return os.path.abspath("models")
+
+
+# Function to list the model files in a folder
+def list_model_files(model_dir=None):
+    return sorted(glob.glob(os.path.join(model_dir or default_model_dir(), "*.txt")))
+
+
+# The data is sent once to every worker process when it starts, not with every model
+_worker = {}
+
+
+def _init_worker(x, y):
+    _worker["x"] = np.asarray(x, dtype=float)
+    _worker["y"] = np.asarray(y, dtype=float)
+
+
+# Function to fit one model file to the data, it runs inside a worker process
+# Only the fit runs here, the statistics of all the models are calculated together afterwards
+# Errors are returned with the result, so one model that does not fit does not stop the comparison
+def fit_model_file(model_path):
+    result = {"model": os.path.splitext(os.path.basename(model_path))[0], "path": model_path, "error": ""}
+    start = time.perf_counter()
+    try:
+        formula, param_names, params = read_model_file(model_path)
+        result["formula"] = formula
+        result["param_names"] = param_names
+        model = compile_model(formula, param_names)
+        jac = compile_jacobian(formula, param_names)
+        # Large data sets are fitted coarse to fine, as in engine.fit_formula
+        fit_function = coarse_to_fine_params if len(_worker["x"]) > LARGE_DATA_POINTS else fit_params
+        result["params"], result["pcov"], result["y_fit"] = fit_function(model, _worker["x"], _worker["y"], params, jac)
+    except Exception as e:
+        result["error"] = str(e)
+    result["fit_time"] = time.perf_counter() - start
+    return result
+
+
+# Function to calculate the statistics of every fitted model in one vectorized call
+# The fitted values of all the models are stacked into one array, one row per model
+def add_statistics(results, y):
+    fitted = [result for result in results if not result["error"]]
+    if not fitted:
+        return
+    k = np.array([len(result["params"]) for result in fitted])
+    statistics = compute_fit_statistics(y, np.vstack([result.pop("y_fit") for result in fitted]), k,
+                                        [result["pcov"] for result in fitted])
+    for row, result in enumerate(fitted):
+        result.update(make_result(result["param_names"], result["params"], result["pcov"], statistics, row))
+        result.pop("pcov")
+
+
+# Function to rank the results, the models that failed to fit always come last
+# key is the statistic to rank by, adjusted R-squared is ranked highest first, the rest lowest first
+# Models whose statistic is undefined, like adjusted R-squared with no more points than parameters,
+# come after the ones that have it
+def rank_results(results, key="adj_r_squared"):
+    def sort_key(result):
+        if result["error"]:
+            return (2, 0)
+        value = result[key]
+        if math.isnan(value):
+            return (1, 0)
+        return (0, -value if key in ("adj_r_squared", "r_squared") else value)
+
+    return sorted(results, key=sort_key)
+
+
+# Function to fit every model file to the data on a pool of worker processes and rank them
+# callback is called with the number of fitted models after every model, the models that have not
+# started are cancelled if it raises
+def compare_models(model_paths, x, y, workers=None, key="adj_r_squared", callback=None):
+    if not model_paths:
+        return []
+    workers = min(len(model_paths), workers or os.cpu_count() or 1)
+    results = [None] * len(model_paths)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(x, y))
+    try:
+        futures = {executor.submit(fit_model_file, model_path): index for index, model_path in enumerate(model_paths)}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if callback is not None:
+                callback(fitted=done, models=len(model_paths))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    add_statistics(results, np.asarray(y, dtype=float))
+    return rank_results(results, key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit every model to a data file and rank them")
+    parser.add_argument("data", help="data file, for example example.csv")
+    parser.add_argument("-m", "--models", default=None, help="folder with the model files, models by default")
+    parser.add_argument("-k", "--key", default="adj_r_squared", choices=["adj_r_squared", "aic", "bic", "sse"],
+                        help="statistic to rank by")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    x, y, _, _ = read_data_file(args.data)
+    results = compare_models(list_model_files(args.models), x, y, args.workers, args.key)
+
+    print("{:<4} {:<20} {:>12} {:>12} {:>12} {:>14} {:>10}".format("Rank", "Model", "Adj R2", "AIC", "BIC", "SSE", "Time (ms)"))
+    for rank, result in enumerate(results, 1):
+        if result["error"]:
+            print("{:<4} {:<20} failed: {}".format(rank, result["model"], result["error"]))
+            continue
+        print("{:<4} {:<20} {:>12.4f} {:>12.4f} {:>12.4f} {:>14.6g} {:>10.1f}".format(
+            rank, result["model"], result["adj_r_squared"], result["aic"], result["bic"], result["sse"], result["fit_time"] * 1000))
+
+
+if __name__ == "__main__":
+    main()
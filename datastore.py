@@ -0,0 +1,205 @@
+import atexit
+import os
+import tempfile
+import warnings
+import numpy as np
+
+# The data points are kept in two contiguous float64 arrays instead of one Entry widget per value
+# Files are read in bulk by numpy, in chunks of rows, and exports that are too big to keep in memory
+# are read into a memory mapped .npy file in the temporary folder.
+
+# The number of rows read from a file at once
+CHUNK_ROWS = 1_000_000
+
+# Files bigger than this are read into a memory mapped file instead of memory, 256 MB
+MMAP_BYTES = 256 * 1024 * 1024
+
+
+# Function to check if a string is a number, used to detect the header of a data file
+def is_number(string):
+    try:
+        float(string)
+        return True
+    except ValueError:
+        return False
+
+
+# Function to read the header of a data file, it returns the axis labels and whether there is a header
+# If the first line contains anything other than a number then it is the header
+def read_header(file_path):
+    with open(file_path, "r", encoding="UTF-8") as file:
+        for line in file:
+            if line.strip():
+                first = [value.strip() for value in line.split(",")]
+                if len(first) < 2:
+                    raise ValueError("A data file needs two columns, x and y")
+                if not is_number(first[0]) or not is_number(first[1]):
+                    return first[0], first[1], True
+                return "", "", False
+    raise ValueError("The data file is empty")
+
+
+# Function to count the lines of a file without parsing it, used to size the memory mapped file
+def count_lines(file_path):
+    lines = 0
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            lines += block.count(b"\n")
+    return lines + 1
+
+
+# Function to find the first line of a data file that is not an x and a y value, it returns its line
+# number, counting from 1 like a text editor, and the line, or None if every line is fine
+# numpy reports the row within the chunk it was reading, so a bad line is looked up again in the file
+def find_bad_line(file_path, has_header):
+    with open(file_path, "r", encoding="UTF-8") as file:
+        for number, line in enumerate(file, 1):
+            values = [value.strip() for value in line.split("#")[0].split(",")]
+            if values == [""]:
+                continue
+            if has_header:
+                has_header = False
+                continue
+            if len(values) < 2 or not is_number(values[0]) or not is_number(values[1]):
+                return number, line.strip()
+    return None
+
+
+# Function to read the x and y columns of a file, chunk_rows rows at a time
+# Each chunk is passed to store, which puts it in place. Empty lines are skipped.
+def read_chunks(file_path, has_header, store, chunk_rows=CHUNK_ROWS):
+    rows = 0
+    with open(file_path, "r", encoding="UTF-8") as file:
+        if has_header:
+            for line in file:
+                if line.strip():
+                    break
+        while True:
+            # numpy warns about empty lines and about the empty chunk at the end of the file
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                try:
+                    chunk = np.loadtxt(file, delimiter=",", usecols=(0, 1), max_rows=chunk_rows, ndmin=2, dtype=np.float64)
+                except ValueError as e:
+                    bad_line = find_bad_line(file_path, has_header)
+                    if bad_line is None:
+                        raise
+                    raise ValueError("Line {} of the data file is not an x and a y value: {}".format(*bad_line)) from e
+            if len(chunk) == 0:
+                break
+            store(rows, chunk)
+            rows += len(chunk)
+    return rows
+
+
+# Function to delete the file behind a memory map once the map is open
+# The map keeps the data on POSIX systems. Windows can not delete a file that is mapped, so there the
+# file is deleted when the program exits.
+def remove_mapped_file(file_path):
+    try:
+        os.remove(file_path)
+    except OSError:
+        atexit.register(remove_file_quietly, file_path)
+
+
+def remove_file_quietly(file_path):
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+# Function to load a csv file with x and y columns, it returns x, y and the axis labels from the header
+# Files bigger than mmap_bytes are read into a memory mapped file, so they do not have to fit in memory
+def load_csv(file_path, chunk_rows=CHUNK_ROWS, mmap_bytes=MMAP_BYTES):
+    x_label, y_label, has_header = read_header(file_path)
+
+    if os.path.getsize(file_path) > mmap_bytes:
+        handle, mmap_path = tempfile.mkstemp(suffix=".npy")
+        os.close(handle)
+        # One row for x and one for y, so both columns are contiguous
+        try:
+            data = np.lib.format.open_memmap(mmap_path, mode="w+", dtype=np.float64, shape=(2, count_lines(file_path)))
+        finally:
+            remove_mapped_file(mmap_path)
+
+        def store(start, chunk):
+            data[:, start:start + len(chunk)] = chunk.T
+
+        rows = read_chunks(file_path, has_header, store, chunk_rows)
+        data.flush()
+        return data[0, :rows], data[1, :rows], x_label, y_label
+
+    chunks = []
+    read_chunks(file_path, has_header, lambda start, chunk: chunks.append(chunk), chunk_rows)
+    data = np.concatenate(chunks) if chunks else np.empty((0, 2))
+    # Copy the columns, so x and y are contiguous
+    return np.ascontiguousarray(data[:, 0]), np.ascontiguousarray(data[:, 1]), x_label, y_label
+
+
+# Function to save x and y to a csv file, with the axis labels as the header if there are any
+def save_csv(file_path, x, y, x_label="", y_label=""):
+    header = "{},{}".format(x_label, y_label) if x_label or y_label else ""
+    np.savetxt(file_path, np.column_stack([x, y]), delimiter=",", fmt="%.17g", header=header, comments="", encoding="UTF-8")
+
+
+# The data points of the GUI, empty cells are stored as nan and left out of the fit
+class DataStore:
+    def __init__(self, rows=0):
+        self.x = np.full(rows, np.nan)
+        self.y = np.full(rows, np.nan)
+        self.x_label = ""
+        self.y_label = ""
+
+    def __len__(self):
+        return len(self.x)
+
+    # Function to replace the data with the contents of a csv file
+    def load(self, file_path):
+        self.x, self.y, self.x_label, self.y_label = load_csv(file_path)
+
+    # Function to save the data to a csv file
+    def save(self, file_path):
+        save_csv(file_path, self.x, self.y, self.x_label, self.y_label)
+
+    # Function to add empty rows at the end
+    def add_rows(self, count=1):
+        self.x = np.concatenate([self.x, np.full(count, np.nan)])
+        self.y = np.concatenate([self.y, np.full(count, np.nan)])
+
+    # Function to remove the last row
+    def remove_last(self):
+        self.x = self.x[:-1]
+        self.y = self.y[:-1]
+
+    # Function to set one cell, column 0 is x and column 1 is y
+    # Memory mapped data is copied into memory before the first edit, the fits that are running keep
+    # the read-only views valid gave them of the mapped file, so they do not see the edit
+    def set_value(self, row, column, value):
+        if isinstance(self.x, np.memmap):
+            self.x = np.array(self.x)
+            self.y = np.array(self.y)
+        (self.x if column == 0 else self.y)[row] = value
+
+    # Function to remove all the data
+    def clear(self, rows=0):
+        self.__init__(rows)
+
+    # Function to get the rows where both x and y are filled in, these are the ones that are fitted
+    # A fit running in the background must not see the cells edited after it started, so they are copies
+    # Memory mapped data is too big to copy on every fit, it is returned as read-only views instead, and
+    # set_value copies it before the first edit. Callers that change the arrays have to copy them
+    def valid(self):
+        mask = np.isfinite(self.x) & np.isfinite(self.y)
+        if not mask.all():
+            return self.x[mask], self.y[mask]
+        if isinstance(self.x, np.memmap):
+            return read_only(self.x), read_only(self.y)
+        return self.x.copy(), self.y.copy()
+
+
+# Function to get a view of an array that cannot be written to
+def read_only(array):
+    view = array.view(np.ndarray)
+    view.flags.writeable = False
+    return view
@@ -0,0 +1,199 @@
+import contextlib
+import cProfile
+import io
+import itertools
+import json
+import math
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Records where the time of every fit, brute force search and report goes
+# Every job gets a FitRecord. The code that does the work wraps each stage in record.stage(name), which
+# stores its wall time, and adds what it knows about the fit with record.set, for example the number of
+# function evaluations and the status of the optimizer. record.track() around the heavy part of a job
+# measures its peak memory with tracemalloc and runs cProfile, each only if it was asked for, because
+# both slow the job down and the stage times of a small fit would no longer be real.
+# The records are shown in the Diagnostics window and can be exported as json, or as a Chrome trace that
+# can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+# The number of records that are kept, older ones are dropped
+MAX_RECORDS = 200
+
+# The number of functions shown in the text of a cProfile capture
+PROFILE_LINES = 40
+
+# tracemalloc is only running while at least one record is being tracked, it slows down allocations
+_tracking = {"count": 0, "lock": threading.Lock()}
+
+
+# Function to time a stage if there is a record, so the fitting functions can be called without one
+def stage(record, name):
+    if record is None:
+        return contextlib.nullcontext()
+    return record.stage(name)
+
+
+class FitRecord:
+    def __init__(self, record_id, name, profile=False, memory=False):
+        self.record_id = record_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.created = time.time()
+        self.stages = []
+        self.info = {}
+        self.peak_memory = None
+        self.memory_requested = memory
+        self.profile_requested = profile
+        self.profile = None
+
+    # Function to time a stage of the job, stages can run on different threads
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({"name": name, "start": start, "duration": time.perf_counter() - start,
+                                "thread": threading.get_ident()})
+
+    # Function to add information about the fit, for example nfev or the status of the optimizer
+    def set(self, **info):
+        self.info.update(info)
+
+    # Function to measure the peak memory of a part of the job and to profile it, if those were asked for
+    # cProfile only sees the thread it is enabled on, so this has to wrap the work on the worker thread
+    @contextlib.contextmanager
+    def track(self):
+        if self.memory_requested:
+            with _tracking["lock"]:
+                if _tracking["count"] == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _tracking["started"] = True
+                _tracking["count"] += 1
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        profiler = cProfile.Profile() if self.profile_requested else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profile = profile_text(profiler)
+            if self.memory_requested:
+                peak = tracemalloc.get_traced_memory()[1] - start_memory
+                self.peak_memory = max(peak, self.peak_memory or 0)
+                with _tracking["lock"]:
+                    _tracking["count"] -= 1
+                    if _tracking["count"] == 0 and _tracking.pop("started", False):
+                        tracemalloc.stop()
+
+    # The time from the start of the job to the end of its last stage, in seconds
+    def wall_time(self):
+        if not self.stages:
+            return 0.0
+        return max(stage["start"] + stage["duration"] for stage in self.stages) - self.start
+
+    # Function to get the total time of every stage, a stage that ran more than once is added up
+    def stage_times(self):
+        times = {}
+        for stage in self.stages:
+            times[stage["name"]] = times.get(stage["name"], 0.0) + stage["duration"]
+        return times
+
+    def to_dict(self):
+        return {
+            "id": self.record_id,
+            "name": self.name,
+            "created": self.created,
+            "wall_time": self.wall_time(),
+            "stages": [{"name": stage["name"], "start": stage["start"] - self.start, "duration": stage["duration"]}
+                       for stage in self.stages],
+            "peak_memory": self.peak_memory,
+            "info": self.info,
+            "profile": self.profile,
+        }
+
+
+# Function to turn a cProfile capture into text, the functions that took the most time first
+def profile_text(profiler, lines=PROFILE_LINES):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(lines)
+    return stream.getvalue()
+
+
+class Diagnostics:
+    def __init__(self, max_records=MAX_RECORDS):
+        self.records = []
+        self.max_records = max_records
+        self.ids = itertools.count(1)
+        self.profile_next = False
+        self.track_memory = False
+        self.lock = threading.Lock()
+
+    # Function to start the record of a new job
+    # If profile_next is set the job is profiled with cProfile, only that one job. If track_memory is set
+    # the peak memory of every job is measured until it is unset.
+    def new_record(self, name):
+        with self.lock:
+            record = FitRecord(next(self.ids), name, profile=self.profile_next, memory=self.track_memory)
+            self.profile_next = False
+            self.records.append(record)
+            del self.records[:-self.max_records]
+        return record
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def to_json(self, file_path):
+        with open(file_path, "w") as file:
+            json.dump(json_safe([record.to_dict() for record in self.records]), file, indent=2, default=json_value,
+                      allow_nan=False)
+        return file_path
+
+    # Function to export the records in the Chrome trace event format
+    # Every job is one row of the trace, with its stages nested under it
+    def to_chrome_trace(self, file_path):
+        events = []
+        if self.records:
+            origin = min(record.start for record in self.records)
+            pid = os.getpid()
+            for record in self.records:
+                events.append({"name": record.name, "cat": "job", "ph": "X", "pid": pid, "tid": record.record_id,
+                               "ts": (record.start - origin) * 1e6, "dur": record.wall_time() * 1e6,
+                               "args": dict(record.info, peak_memory=record.peak_memory)})
+                for stage in record.stages:
+                    events.append({"name": stage["name"], "cat": "stage", "ph": "X", "pid": pid, "tid": record.record_id,
+                                   "ts": (stage["start"] - origin) * 1e6, "dur": stage["duration"] * 1e6})
+                events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": record.record_id,
+                               "args": {"name": "{} {}".format(record.name, record.record_id)}})
+        with open(file_path, "w") as file:
+            json.dump(json_safe({"traceEvents": events, "displayTimeUnit": "ms"}), file, default=json_value, allow_nan=False)
+        return file_path
+
+
+# Function to turn the numpy numbers in the information of a record into something json can write
+def json_value(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+# Function to replace the numbers json has no value for, like the nan statistics of a fit with as
+# many points as parameters, with None, so the output is strict json every reader can parse
+# numpy numbers and arrays are turned into python ones first
+def json_safe(value):
+    if hasattr(value, "tolist"):
+        return json_safe(value.tolist())
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
@@ -0,0 +1,231 @@
+import numpy as np
+from scipy.optimize import curve_fit, least_squares
+from fit_statistics import compute_fit_statistics
+from datastore import load_csv
+from diagnostics import stage
+from model_compiler import compile_model, compile_jacobian
+
+# The headless fitting engine, everything needed to fit a model without the GUI
+# It is used by the GUI in main.py and by the batch fitting command line in batch.py
+
+# Data sets with more points than this are fitted coarse to fine, see coarse_to_fine_fit
+LARGE_DATA_POINTS = 100_000
+
+# The number of points of the subsample the coarse fit is made on
+COARSE_POINTS = 5_000
+
+# The number of points the model is evaluated on at once in the fine fit, it caps the memory the
+# temporary arrays of the formula take
+CHUNK_POINTS = 65_536
+
+
+# Function to read a model file, the first line is the formula and the rest are "name,value" pairs
+def read_model_file(file_path):
+    with open(file_path, "r", encoding="UTF-8") as file:
+        lines = [line.strip() for line in file.read().split("\n") if line.strip()]
+
+    formula = lines[0]
+    param_names = []
+    params = []
+    for line in lines[1:]:
+        param_name, param_value = line.split(",")[:2]
+        param_names.append(param_name.strip())
+        params.append(float(param_value))
+    return formula, param_names, params
+
+
+# Function to read a data file, it returns the x and y values and the axis labels from the header if there is one
+def read_data_file(file_path):
+    return load_csv(file_path)
+
+
+# Function to fit a model to the data, it returns the parameters, their covariance and the fitted y values
+# If an info dictionary is passed, the number of evaluations and the status of the optimizer are stored in it
+def fit_params(model, x, y, params, jac=None, info=None):
+    # Perform curve fitting, with the analytic jacobian if there is one
+    if info is None:
+        params, pcov = curve_fit(model, x, y, p0=params, jac=jac)
+    else:
+        params, pcov, infodict, message, status = curve_fit(model, x, y, p0=params, jac=jac, full_output=True)
+        info["nfev"] = int(infodict.get("nfev", 0))
+        if "njev" in infodict:
+            info["njev"] = int(infodict["njev"])
+        info["status"] = int(status)
+        info["message"] = " ".join(str(message).split())
+    return params, pcov, model(x, *params)
+
+
+# Function to put the parameters and the statistics of a fit together in one dictionary
+# statistics comes from fit_statistics.compute_fit_statistics, with pcov passed to it for the standard
+# errors of the parameters, row picks one fit out of a stacked batch
+def make_result(param_names, params, pcov, statistics, row=None):
+    def value(key):
+        return float(statistics[key] if row is None else statistics[key][row])
+
+    k = len(params)
+    if param_names is None:
+        param_names = ["p{}".format(i + 1) for i in range(k)]
+    param_std_err = statistics.get("param_std_err")
+    if param_std_err is None:
+        param_std_err = np.full(k, np.nan)
+    elif row is not None:
+        param_std_err = param_std_err[row]
+
+    return {
+        "param_names": list(param_names),
+        "params": [float(value) for value in params],
+        "param_std_err": [float(value) for value in param_std_err],
+        "pcov": pcov,
+        "r_squared": value("r_squared"),
+        "adj_r_squared": value("adj_r_squared"),
+        "std_err": value("std_err"),
+        "p_value": value("p_value"),
+        "sse": value("sse"),
+        "rmse": value("rmse"),
+        "aic": value("aic"),
+        "bic": value("bic"),
+        "n": int(statistics["n"]),
+        "k": k,
+    }
+
+
+# Function to fit a model to the data and calculate the statistics of the fit
+# It returns a dictionary, so the results can be shown in the GUI or written to a file
+# If a diagnostics record is passed, the stages are timed and the optimizer information is added to it
+def fit(model, x, y, params, param_names=None, jac=None, record=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    info = None if record is None else {}
+    with stage(record, "curve_fit"):
+        params, pcov, y_fit = fit_params(model, x, y, params, jac, info)
+
+    # Calculate every statistic of the fit in one pass
+    with stage(record, "statistics"):
+        statistics = compute_fit_statistics(y, y_fit, len(params), pcov)
+    if record is not None:
+        record.set(n=len(x), **info)
+    return make_result(param_names, params, pcov, statistics)
+
+
+# Function to pick a subsample of the data spread evenly over the x range
+# The points are sorted by x and split into as many strata as points are wanted. "stratified" picks
+# one random point from every stratum, "binned" takes the mean x and y of every stratum, which also
+# averages out the noise.
+def subsample(x, y, points, method="stratified", seed=0):
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= points:
+        return x, y
+    order = np.argsort(x, kind="stable")
+    edges = np.linspace(0, len(x), points + 1).astype(np.int64)
+    counts = np.diff(edges)
+    if method == "binned":
+        return (np.add.reduceat(x[order].astype(float), edges[:-1]) / counts,
+                np.add.reduceat(y[order].astype(float), edges[:-1]) / counts)
+    if method != "stratified":
+        raise ValueError("Unknown subsample method: {}".format(method))
+    picks = edges[:-1] + (np.random.default_rng(seed).random(points) * counts).astype(np.int64)
+    index = np.sort(order[picks])
+    return x[index], y[index]
+
+
+# Function to fit a model to a lot of data, evaluating the model and its jacobian a chunk of points
+# at a time into buffers that are allocated once. x and y can be float32 to halve their memory, every
+# chunk is converted to float64 before the model sees it. It returns the same as fit_params.
+def fit_chunked(model, x, y, params, jac=None, chunk_points=CHUNK_POINTS, info=None):
+    n, k = len(x), len(params)
+    residuals = np.empty(n)
+    jacobian = np.empty((n, k))
+
+    # Without a jacobian the solver estimates it from the residuals at nearby parameters and compares
+    # them with the residuals at the parameters, so every call has to return its own array
+    def residual_function(p):
+        for start in range(0, n, chunk_points):
+            end = start + chunk_points
+            residuals[start:end] = model(x[start:end].astype(float), *p) - y[start:end]
+        return residuals if jac is not None else residuals.copy()
+
+    def jacobian_function(p):
+        for start in range(0, n, chunk_points):
+            end = start + chunk_points
+            jacobian[start:end] = jac(x[start:end].astype(float), *p)
+        return jacobian
+
+    # With a jacobian the Levenberg-Marquardt solver copies the residuals and the jacobian it is given,
+    # so the buffers can be reused
+    solution = least_squares(residual_function, np.asarray(params, dtype=float), method="lm",
+                             jac=jacobian_function if jac is not None else "2-point")
+    if not solution.success:
+        raise RuntimeError("Optimal parameters not found: {}".format(solution.message))
+    params = solution.x
+
+    # The covariance of the parameters, estimated from the jacobian the same way curve_fit does
+    _, singular, vt = np.linalg.svd(solution.jac, full_matrices=False)
+    keep = singular > np.finfo(float).eps * max(solution.jac.shape) * singular[0]
+    pcov = (vt[keep].T / singular[keep] ** 2) @ vt[keep]
+    y_fit = residual_function(params) + y
+    sse = float(np.dot(residuals, residuals))
+    pcov = pcov * (sse / (n - k)) if n > k else np.full((k, k), np.inf)
+
+    if info is not None:
+        info.update(nfev=int(solution.nfev), njev=int(solution.njev or 0), status=int(solution.status),
+                    message=" ".join(str(solution.message).split()))
+    return params, pcov, y_fit
+
+
+# Function to fit a model to a large data set, first on a subsample and then on all the data
+# The coarse fit on a few thousand points does most of the work, the fit on all the data starts from
+# its solution and only needs a few iterations. It returns the same as fit_params, and if info is
+# passed the coarse parameters and the solver information of the fine fit are stored in it.
+def coarse_to_fine_params(model, x, y, params, jac=None, coarse_points=COARSE_POINTS, method="stratified",
+                          chunk_points=CHUNK_POINTS, info=None, record=None):
+    # If the coarse fit fails, the fine fit starts from the given parameters
+    with stage(record, "coarse_fit"):
+        x_coarse, y_coarse = subsample(x, y, coarse_points, method)
+        try:
+            coarse, _, _ = fit_params(model, x_coarse.astype(float), y_coarse.astype(float), params, jac)
+        except Exception:
+            coarse = np.asarray(params, dtype=float)
+
+    with stage(record, "fine_fit"):
+        params, pcov, y_fit = fit_chunked(model, x, y, coarse, jac, chunk_points, info)
+
+    if info is not None:
+        info.update(coarse_points=len(x_coarse), coarse_params=[float(value) for value in coarse])
+    return params, pcov, y_fit
+
+
+# Function to fit a model to a large data set coarse to fine, see coarse_to_fine_params
+# With low_memory the data is kept as float32.
+def coarse_to_fine_fit(model, x, y, params, param_names=None, jac=None, coarse_points=COARSE_POINTS,
+                       method="stratified", low_memory=False, chunk_points=CHUNK_POINTS, record=None):
+    dtype = np.float32 if low_memory else float
+    x = np.asarray(x, dtype=dtype)
+    y = np.asarray(y, dtype=dtype)
+
+    info = {}
+    params, pcov, y_fit = coarse_to_fine_params(model, x, y, params, jac, coarse_points, method, chunk_points,
+                                                info, record)
+    coarse = info.pop("coarse_params")
+
+    with stage(record, "statistics"):
+        statistics = compute_fit_statistics(y, y_fit, len(params), pcov)
+    if record is not None:
+        record.set(n=len(x), **info)
+    result = make_result(param_names, params, pcov, statistics)
+    result["coarse_params"] = coarse
+    return result
+
+
+# Function to fit a model given as a formula, used when there is no python function yet
+# Large data sets are fitted coarse to fine
+def fit_formula(formula, param_names, params, x, y):
+    model = compile_model(formula, param_names)
+    jac = compile_jacobian(formula, param_names)
+    if len(x) > LARGE_DATA_POINTS:
+        result = coarse_to_fine_fit(model, x, y, params, param_names, jac)
+    else:
+        result = fit(model, x, y, params, param_names, jac)
+    result["formula"] = formula
+    return result
@@ -0,0 +1,96 @@
+import numpy as np
+from scipy.special import stdtr
+
+# The statistics of a fit, all computed in one vectorized pass over the observed and fitted values
+# y and y_fit can be 1-D for one fit, or 2-D with one fit per row, for example every model of a comparison
+# fitted to the same data. Then every statistic is an array with one value per row.
+#
+# R-squared, the p-value and the standard error are those of a linear regression of y_fit on y, the same
+# numbers scipy.stats.linregress gives, without calling it once per fit.
+
+
+# Function to calculate the adjusted R-squared, n is the number of points and k the number of parameters
+# It is undefined (nan) without at least k + 2 points, even for a perfect fit
+def adjusted_r_squared(r_squared, n, k):
+    df = np.asarray(n - k - 1, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        adjusted = 1 - (1 - r_squared) * ((n - 1) / df)
+    return np.where(df > 0, adjusted, np.nan)[()]
+
+
+# Function to calculate the Akaike and Bayesian information criteria from the sum of squared errors
+# Lower is better, they reward a good fit but penalize every extra parameter
+def information_criteria(sse, n, k):
+    with np.errstate(divide="ignore"):
+        log_likelihood_term = n * np.log(sse / n)
+    return log_likelihood_term + 2 * k, log_likelihood_term + k * np.log(n)
+
+
+# Function to calculate every statistic of one or more fits
+# k is the number of parameters, a number or one per row. pcov is the covariance matrix of the parameters
+# from curve_fit, k x k or one per row, its square root diagonal gives the standard error of each parameter.
+# Fits with different numbers of parameters can pass a list with one matrix per row.
+def compute_fit_statistics(y, y_fit, k, pcov=None):
+    y = np.asarray(y, dtype=float)
+    y_fit = np.asarray(y_fit, dtype=float)
+    y, y_fit = np.broadcast_arrays(y, y_fit)
+    n = y.shape[-1]
+    k = np.asarray(k)
+
+    # The means, deviations and sums of squares, each computed once and shared by all the statistics
+    y_mean = y.mean(axis=-1, keepdims=True)
+    fit_mean = y_fit.mean(axis=-1, keepdims=True)
+    y_dev = y - y_mean
+    fit_dev = y_fit - fit_mean
+    residuals = y - y_fit
+
+    ss_y = np.einsum("...i,...i->...", y_dev, y_dev) / n
+    ss_fit = np.einsum("...i,...i->...", fit_dev, fit_dev) / n
+    ss_cross = np.einsum("...i,...i->...", y_dev, fit_dev) / n
+    sse = np.einsum("...i,...i->...", residuals, residuals)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # The linear regression of y_fit on y
+        denominator = np.sqrt(ss_y * ss_fit)
+        r = np.where(denominator == 0, 0.0, ss_cross / np.where(denominator == 0, 1.0, denominator))
+        r = np.clip(r, -1.0, 1.0)
+        slope = ss_cross / ss_y
+        intercept = fit_mean[..., 0] - slope * y_mean[..., 0]
+
+        df = n - 2
+        tiny = 1.0e-20
+        t = r * np.sqrt(df / ((1.0 - r + tiny) * (1.0 + r + tiny)))
+        # The two sided p-value of the t statistic, from the t distribution with df degrees of freedom
+        p_value = 2 * stdtr(df, -np.abs(t))
+        std_err = np.sqrt((1 - r ** 2) * ss_fit / ss_y / df)
+
+        r_squared = r ** 2
+        adj_r_squared = adjusted_r_squared(r_squared, n, k)
+        aic, bic = information_criteria(sse, n, k)
+        rmse = np.sqrt(sse / n)
+
+    statistics = {
+        "r_squared": r_squared,
+        "adj_r_squared": adj_r_squared,
+        "slope": slope,
+        "intercept": intercept,
+        "p_value": p_value,
+        "std_err": std_err,
+        "sse": sse,
+        "rmse": rmse,
+        "aic": aic,
+        "bic": bic,
+        "n": n,
+    }
+    if isinstance(pcov, (list, tuple)):
+        statistics["param_std_err"] = [np.sqrt(np.abs(np.diag(np.asarray(matrix, dtype=float)))) for matrix in pcov]
+    elif pcov is not None:
+        pcov = np.asarray(pcov, dtype=float)
+        statistics["param_std_err"] = np.sqrt(np.abs(np.diagonal(pcov, axis1=-2, axis2=-1)))
+
+    # A single fit gives plain numbers instead of 0-d arrays
+    if y.ndim == 1:
+        for key, value in statistics.items():
+            if isinstance(value, np.ndarray) and value.ndim == 0:
+                statistics[key] = float(value)
+    return statistics
@@ -1,49 +1,69 @@
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-from scipy.stats import linregress
+import numpy as np
+from diagnostics import stage
+from fit_statistics import compute_fit_statistics, adjusted_r_squared, information_criteria
+from model_compiler import compile_model
+from multistart import multistart_fit, default_bounds
 
-# Function to calculate R-squared
+# Function to calculate R-squared, the p-value and the standard error of a fit
+# They come from a linear regression of y_fit on y, see fit_statistics.py for all the statistics at once
 def calculate_statistics(y, y_fit):
-    # y_mean = np.mean(y)
-    # ss_total = np.sum((y - y_mean) ** 2)
-    # ss_residual = np.sum((y - y_fit) ** 2)
-    # r_squared = 1 - (ss_residual / ss_total)
-    # return r_squared
-    slope, intercept, r_value, p_value, std_err = linregress(y, y_fit)
+    statistics = compute_fit_statistics(y, y_fit, 0)
     return {
-        'r_squared': r_value ** 2,
-        'slope': slope,
-        'intercept': intercept,
-        'p_value': p_value,
-        'std_err': std_err
+        'r_squared': statistics['r_squared'],
+        'slope': statistics['slope'],
+        'intercept': statistics['intercept'],
+        'p_value': statistics['p_value'],
+        'std_err': statistics['std_err']
     }
 
 def calculate_adj_r_square(r_square, n, k):
-    adj_r_square = 1 - (1 - r_square) * ((n - 1) / (n - k - 1))
-    return adj_r_square
+    return adjusted_r_squared(r_square, n, k)
 
+# Function to calculate the Akaike and Bayesian information criteria from the sum of squared errors
+def calculate_information_criteria(sse, n, k):
+    return information_criteria(sse, n, k)
 
-# Bruteforce function to find the best fit, it takes a lot of time
-# but the gist is that it takes a list of initial parameters and
-# then tries to fit the curve with each of the parameters and then
-# returns the best fit
-def bruteforce_fit(func, x, y, initial_parameters):
-    best_fit = None
-    best_fit_parameters = None
-    best_fit_statistics = None
-    bruteforce_params = [0.1, -0.1,100,1,1e6,-0.1e3,0.1e3,0.1e6,-0.1e6]
-    for index, initial_parameter in enumerate(initial_parameters):
-        # get the index number of the parameter
-        try:
-            for bruteforce_param in bruteforce_params:
-                initial_parameters[index] = bruteforce_param
-                popt, pcov = curve_fit(func, x, y, initial_parameters)
-                y_fit = func(x, *popt)
-                statistics = calculate_statistics(y, y_fit)
-                if best_fit is None or statistics['r_squared'] > best_fit_statistics['r_squared']:
-                    best_fit = y_fit
-                    best_fit_parameters = popt
-                    best_fit_statistics = statistics
-        except:
-            pass
-    return best_fit, best_fit_parameters, best_fit_statistics
\ No newline at end of file
+
+# Bruteforce function to find the best fit, it screens thousands of candidate parameters spread over
+# the bounds in a few vectorized numpy calls, then starts curve_fit from the best of them on a pool of
+# worker processes (see multistart.py) and returns the best fit
+# The bounds can be inf where a parameter has no bound. The search covers three decades on either side
+# of the initial parameters where there is no bound, but only the bounds that were given limit the fits
+# It returns the fitted y values, the parameters and the statistics of the best fit, and the list of
+# distinct optima that were found, best first
+# If a diagnostics record is passed, the search and the statistics are timed and the evaluations counted
+# seed fixes the starting points, so the same search can be run again, for example to time it
+def bruteforce_fit(formula, param_names, x, y, initial_parameters, lower=None, upper=None,
+                   starts=32, method="sobol", top=5, workers=None, screen=4096, diagnostics=None,
+                   callback=None, record=None, seed=None):
+    bounds = None
+    default_lower, default_upper = default_bounds(initial_parameters)
+    if lower is not None or upper is not None:
+        lower = np.full(len(initial_parameters), -np.inf) if lower is None else np.asarray(lower, dtype=float)
+        upper = np.full(len(initial_parameters), np.inf) if upper is None else np.asarray(upper, dtype=float)
+        bounds = (lower, upper)
+        # Fill in the missing sides from the default search range, kept on the right side of the other bound
+        lower = np.where(np.isinf(lower), np.minimum(default_lower, upper), lower)
+        upper = np.where(np.isinf(upper), np.maximum(default_upper, lower), upper)
+    else:
+        lower, upper = default_lower, default_upper
+
+    if record is not None and diagnostics is None:
+        diagnostics = {}
+    with stage(record, "multistart"):
+        optima = multistart_fit(formula, param_names, x, y, lower, upper, starts=starts, method=method,
+                                top=top, workers=workers, initial_parameters=initial_parameters,
+                                seed=seed, screen=screen, diagnostics=diagnostics, callback=callback,
+                                bounds=bounds)
+    if record is not None:
+        record.set(n=len(x), starts=starts, nfev=diagnostics.get("nfev"), starts_fitted=diagnostics.get("starts_fitted"),
+                   rounds=diagnostics.get("rounds"), screen_time=diagnostics.get("screen_time"), optima=len(optima))
+    if not optima:
+        raise RuntimeError("None of the {} starting points converged".format(starts))
+
+    with stage(record, "statistics"):
+        func = compile_model(formula, param_names)
+        best_fit_parameters = optima[0]["params"]
+        best_fit = func(np.asarray(x, dtype=float), *best_fit_parameters)
+        best_fit_statistics = compute_fit_statistics(y, best_fit, len(best_fit_parameters))
+    return best_fit, best_fit_parameters, best_fit_statistics, optima
@@ -0,0 +1,218 @@
+import argparse
+import numpy as np
+from scipy.optimize import least_squares
+from scipy.sparse import csr_matrix
+from batch import expand_patterns, write_csv, write_json
+from diagnostics import stage
+from engine import read_model_file, read_data_file, make_result
+from fit_statistics import compute_fit_statistics
+from model_compiler import compile_model, compile_jacobian
+
+# Global fitting, one model fitted to several data sets at once
+# Every parameter is either shared, one value for all the data sets, or local, its own value for every
+# data set. For example isotherms measured at several temperatures share Qmax while Kl changes with
+# the temperature. All the data sets are solved as one least squares problem.
+#
+# The parameters are laid out as [shared..., local of data set 1..., local of data set 2..., ...]. The
+# data sets are joined into one array with the index of the data set of every point, so the model and
+# its jacobian are evaluated for all the data sets in one vectorized call, with the local parameters
+# given as one value per point. A point only depends on the shared parameters and the local parameters
+# of its own data set, so the jacobian is block sparse and is passed to least_squares as a sparse matrix.
+# Example:
+#   python global_fit.py models/Langmuir.txt "isotherms/*.csv" --shared Qmax --output results.csv
+
+
+class GlobalModel:
+    def __init__(self, formula, param_names, datasets, shared):
+        self.formula = formula
+        self.param_names = list(param_names)
+        self.model = compile_model(formula, param_names)
+        self.jac = compile_jacobian(formula, param_names)
+
+        self.shared = np.array([bool(value) for value in shared])
+        if len(self.shared) != len(self.param_names):
+            raise ValueError("Every parameter has to be marked as shared or local")
+        self.shared_index = np.flatnonzero(self.shared)
+        self.local_index = np.flatnonzero(~self.shared)
+
+        self.datasets = [(np.asarray(x, dtype=float), np.asarray(y, dtype=float)) for x, y in datasets]
+        if not self.datasets:
+            raise ValueError("There are no data sets to fit")
+        lengths = [len(x) for x, _ in self.datasets]
+        self.offsets = np.cumsum([0] + lengths)
+        self.x = np.concatenate([x for x, _ in self.datasets])
+        self.y = np.concatenate([y for _, y in self.datasets])
+        self.group = np.repeat(np.arange(len(self.datasets)), lengths)
+
+        # Where every parameter of every point is in the parameter vector, one row per point
+        shared_count = len(self.shared_index)
+        local_count = len(self.local_index)
+        self.size = shared_count + local_count * len(self.datasets)
+        columns = np.empty((len(self.x), len(self.param_names)), dtype=np.int64)
+        columns[:, self.shared_index] = np.arange(shared_count)
+        columns[:, self.local_index] = shared_count + self.group[:, None] * local_count + np.arange(local_count)
+        self.columns = columns
+
+        # The sparse structure of the jacobian never changes, only its values do. The shared columns come
+        # before the local ones in every row, so the column indices of a row are already sorted.
+        order = np.r_[self.shared_index, self.local_index]
+        self.order = order
+        self.indices = columns[:, order].ravel()
+        self.indptr = np.arange(0, len(self.x) * len(order) + 1, len(order))
+
+    # Function to get the parameter vector from one value per parameter, or one per data set
+    def pack(self, params):
+        params = np.asarray(params, dtype=float)
+        if params.ndim == 1:
+            params = np.tile(params, (len(self.datasets), 1))
+        theta = np.empty(self.size)
+        theta[:len(self.shared_index)] = params[0, self.shared_index]
+        theta[len(self.shared_index):] = params[:, self.local_index].ravel()
+        return theta
+
+    # Function to get the parameters of every data set from the parameter vector, one row per data set
+    def unpack(self, theta):
+        first_points = self.offsets[:-1]
+        return theta[self.columns[first_points]]
+
+    # Function to get the parameters of every point, as arguments for the compiled model
+    def point_params(self, theta):
+        return [theta[self.columns[0, index]] if self.shared[index] else theta[self.columns[:, index]]
+                for index in range(len(self.param_names))]
+
+    def residuals(self, theta):
+        return self.model(self.x, *self.point_params(theta)) - self.y
+
+    # Function to get the sparse jacobian, each row has one value per parameter of the formula
+    def jacobian(self, theta):
+        values = self.jac(self.x, *self.point_params(theta))
+        return csr_matrix((values[:, self.order].ravel(), self.indices, self.indptr), shape=(len(self.x), self.size))
+
+
+# Function to get the covariance matrix of the parameters from the jacobian at the solution
+# It is the same estimate curve_fit makes, the inverse of J^T J scaled by the variance of the residuals
+def covariance(jacobian, sse, n):
+    jtj = (jacobian.T @ jacobian).toarray()
+    dof = n - jtj.shape[0]
+    if dof <= 0:
+        return np.full(jtj.shape, np.inf)
+    return np.linalg.pinv(jtj) * (sse / dof)
+
+
+# Function to fit one model to several data sets, sharing the parameters marked in shared
+# datasets is a list of (x, y), params the starting values, one per parameter or one row per data set,
+# and lower and upper optional bounds, one per parameter. It returns a dictionary with the statistics
+# of the whole fit and a list with a fit result for every data set, as engine.fit returns them.
+def global_fit(formula, param_names, datasets, shared, params, lower=None, upper=None, record=None):
+    with stage(record, "compile"):
+        problem = GlobalModel(formula, param_names, datasets, shared)
+    if len(problem.x) <= problem.size:
+        raise ValueError("There are {} points for {} parameters".format(len(problem.x), problem.size))
+
+    # The starting point has to be inside the bounds
+    theta = problem.pack(params)
+    bounds = (-np.inf, np.inf)
+    if lower is not None or upper is not None:
+        k = len(problem.param_names)
+        lower = np.full(k, -np.inf) if lower is None else np.asarray(lower, dtype=float)
+        upper = np.full(k, np.inf) if upper is None else np.asarray(upper, dtype=float)
+        bounds = (problem.pack(lower), problem.pack(upper))
+        theta = np.clip(theta, bounds[0], bounds[1])
+
+    with stage(record, "least_squares"):
+        with np.errstate(all="ignore"):
+            solution = least_squares(problem.residuals, theta, jac=problem.jacobian, bounds=bounds,
+                                     method="trf", tr_solver="lsmr", x_scale="jac")
+    if not solution.success:
+        raise RuntimeError("Global fit failed: {}".format(solution.message))
+
+    with stage(record, "statistics"):
+        theta = solution.x
+        residuals = problem.residuals(theta)
+        sse = float(residuals @ residuals)
+        pcov = covariance(problem.jacobian(theta), sse, len(problem.x))
+
+        # The fit result of every data set, with the covariance of the parameters it depends on
+        # A data set is counted as having all the parameters of the formula, shared or not
+        y_fit = residuals + problem.y
+        results = []
+        for index, params_row in enumerate(problem.unpack(theta)):
+            start, end = problem.offsets[index], problem.offsets[index + 1]
+            columns = problem.columns[start]
+            dataset_pcov = pcov[np.ix_(columns, columns)]
+            statistics = compute_fit_statistics(problem.y[start:end], y_fit[start:end], len(params_row), dataset_pcov)
+            results.append(make_result(problem.param_names, params_row, dataset_pcov, statistics))
+        statistics = compute_fit_statistics(problem.y, y_fit, problem.size)
+
+    if record is not None:
+        record.set(n=len(problem.x), nfev=int(solution.nfev), njev=int(solution.njev or 0),
+                   status=int(solution.status), message=solution.message)
+    return {
+        "formula": formula,
+        "param_names": problem.param_names,
+        "shared": [bool(value) for value in problem.shared],
+        "datasets": results,
+        "r_squared": float(statistics["r_squared"]),
+        "adj_r_squared": float(statistics["adj_r_squared"]),
+        "sse": sse,
+        "rmse": float(statistics["rmse"]),
+        "aic": float(statistics["aic"]),
+        "bic": float(statistics["bic"]),
+        "n": len(problem.x),
+        "k": problem.size,
+        "nfev": int(solution.nfev),
+        "message": solution.message,
+    }
+
+
+# Function to fit a formula to several data files, shared marks the parameters shared by all the files
+# It returns the global fit with the file name and axis labels added to the result of every data set
+def global_fit_files(formula, param_names, params, file_paths, shared, lower=None, upper=None, record=None):
+    datasets = []
+    labels = []
+    for file_path in file_paths:
+        x, y, x_label, y_label = read_data_file(file_path)
+        datasets.append((x, y))
+        labels.append((x_label, y_label))
+
+    result = global_fit(formula, param_names, datasets, shared, params, lower, upper, record)
+    for dataset, file_path, (x_label, y_label) in zip(result["datasets"], file_paths, labels):
+        dataset.update(file=file_path, error="", formula=formula, x_label=x_label, y_label=y_label)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit one model to several data files at once, with shared parameters")
+    parser.add_argument("model", help="model file, for example models/Langmuir.txt")
+    parser.add_argument("data", nargs="+", help="data files or glob patterns, for example \"isotherms/*.csv\"")
+    parser.add_argument("-s", "--shared", nargs="+", default=[], help="parameters shared by all the data files, the others are fitted per file")
+    parser.add_argument("-o", "--output", default="global_results.csv", help="output file, .csv or .json")
+    args = parser.parse_args(argv)
+
+    formula, param_names, params = read_model_file(args.model)
+    unknown = [name for name in args.shared if name not in param_names]
+    if unknown:
+        parser.error("unknown parameters: {}".format(", ".join(unknown)))
+
+    shared = [name in args.shared for name in param_names]
+    result = global_fit_files(formula, param_names, params, expand_patterns(args.data), shared)
+    results = result["datasets"]
+    for dataset in results:
+        dataset.pop("pcov")
+
+    if args.output.lower().endswith(".json"):
+        write_json(result, args.output)
+    else:
+        write_csv(results, args.output)
+
+    shared_values = ", ".join("{} = {:.6g}".format(name, value) for name, value, shared in
+                              zip(result["param_names"], results[0]["params"], result["shared"]) if shared)
+    print("Fitted {} files with {} parameters, R-squared {:.4f}, SSE {:.6g}".format(
+        len(results), result["k"], result["r_squared"], result["sse"]))
+    if shared_values:
+        print("Shared: {}".format(shared_values))
+    print("Results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import numpy as np
+
+# Keeps what the last live fit computed, so the next one only redoes what changed
+# The model values of the last fit are kept for every point. When some points are edited, only those
+# are evaluated again to show the statistics of the old parameters on the new data straight away,
+# and the refit starts from the last fitted parameters instead of from scratch.
+
+
+class LiveFitCache:
+    def __init__(self):
+        self.clear()
+
+    # Function to forget the last fit
+    def clear(self):
+        self.formula = None
+        self.param_names = None
+        self.params = None
+        self.x = None
+        self.y = None
+        self.y_model = None
+
+    # Function to check if the cache belongs to this formula and these parameters
+    def matches(self, formula, param_names):
+        return self.params is not None and self.formula == formula and self.param_names == list(param_names)
+
+    # Function to store the result of a fit
+    def store(self, formula, param_names, params, x, y, y_model):
+        self.formula = formula
+        self.param_names = list(param_names)
+        self.params = np.array(params, dtype=float)
+        self.x = np.array(x, dtype=float)
+        self.y = np.array(y, dtype=float)
+        self.y_model = np.array(y_model, dtype=float)
+
+    # Function to get the parameters to start the next fit from
+    # The entry boxes show the last fitted parameters, unless the user typed new ones, so the last fit is
+    # used whenever they still agree, and the values that were typed in otherwise
+    def start_params(self, formula, param_names, entry_params):
+        if self.matches(formula, param_names) and np.allclose(entry_params, self.params, rtol=1e-9, atol=0):
+            return self.params.copy()
+        return np.array(entry_params, dtype=float)
+
+    # Function to check if a fit would give the same result as the last one
+    def unchanged(self, formula, param_names, params, x, y):
+        return (self.matches(formula, param_names) and np.array_equal(params, self.params)
+                and np.array_equal(x, self.x) and np.array_equal(y, self.y))
+
+    # Function to get the model values of the last fitted parameters at the new x values
+    # Only the points whose x changed are evaluated again, it returns None if there is no usable fit
+    def model_values(self, model, formula, param_names, x):
+        if not self.matches(formula, param_names):
+            return None
+        if self.x is not None and len(x) == len(self.x):
+            changed = x != self.x
+            y_model = self.y_model.copy()
+            if changed.any():
+                y_model[changed] = model(x[changed], *self.params)
+            return y_model
+        return model(x, *self.params)
+
+    # Function to get the statistics of the last fitted parameters on the new data, before the refit
+    # fit_statistics needs scipy, it is imported here so the GUI can start without it
+    def preview(self, model, formula, param_names, x, y):
+        from fit_statistics import compute_fit_statistics
+        y_model = self.model_values(model, formula, param_names, x)
+        if y_model is None or len(y) < len(self.params) + 2:
+            return None
+        return compute_fit_statistics(y, y_model, len(self.params))
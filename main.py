@@ -1,69 +1,159 @@
+import importlib
+import threading
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-from scipy.stats import linregress
-from functions import calculate_statistics, calculate_adj_r_square, bruteforce_fit
-import base64
-import io
+from datastore import DataStore
+from model_compiler import compile_model, compile_jacobian
+from worker import FitWorker, FitCancelled
+from diagnostics import Diagnostics
+from live import LiveFitCache
+from project import FitCache, fit_key, save_project, load_project
 import webbrowser
-import re
-from tkinter import Tk, Button, Label, Entry, Frame, messagebox, filedialog
+from multiprocessing import freeze_support
+from tkinter import Tk, Toplevel, Button, Label, Entry, Frame, Scrollbar, Checkbutton, BooleanVar, Text, messagebox, filedialog, ttk
+
+# The number of data rows shown in the grid at once
+VISIBLE_ROWS = 15
+
+# How long live mode waits after the last edit before it refits, in milliseconds
+LIVE_FIT_DELAY = 300
+
+# The number of resampled data sets of the bootstrap, and the most time it may take in seconds
+BOOTSTRAP_RESAMPLES = 2000
+BOOTSTRAP_TIME = 3.0
+
+# The modules that need scipy or matplotlib take most of a second to import, so they are not imported
+# when the program starts. The window comes up first, then they are imported on a background thread,
+# and every function that uses them imports them itself, which waits for the background import if it
+# has not finished yet. The worker processes, which import this file too, never load them at all.
+HEAVY_MODULES = ["engine", "functions", "plotting", "report", "compare", "global_fit", "bootstrap", "landscape"]
+
+# Function to import the heavy modules, it runs on a background thread once the window is up
+def preload_modules():
+    for module_name in HEAVY_MODULES:
+        importlib.import_module(module_name)
+
+# Function to create the plot once matplotlib has been imported, it checks every 50 ms until then
+def show_plot_when_ready():
+    if preload_thread.is_alive():
+        root.after(50, show_plot_when_ready)
+        return
+    get_fit_plot()
+
+# Function to get the plot, it is created the first time it is needed in the place kept for it
+def get_fit_plot():
+    global fit_plot
+    if fit_plot is None:
+        from plotting import FitPlot
+        fit_plot = FitPlot(root)
+        plot_placeholder.destroy()
+        fit_plot.widget.grid(row=0, column=3, columnspan=6, padx=5, pady=5)
+    return fit_plot
 
 # Function to fit the model to data and update the plot
-def fit_model():
-    # Create a figure and plot
-    fig = plt.figure(dpi=150)
-    ax = fig.add_subplot(111)
-    line, = ax.plot([], [], 'r-', label='Fitted Curve')
-    scatter, = ax.plot([], [], 'bo', label='Data Points')
-    ax.set_xlabel(xlabel=x_axis_label.get())
-    ax.set_ylabel(ylabel=y_axis_label.get())
-    ax.legend()
-
-
-    x = np.array([float(entry_x.get()) for entry_x in entries_x])
-    y = np.array([float(entry_y.get()) for entry_y in entries_y])
+# The fit runs on the worker thread, on_done is called once the results are shown
+def fit_model(on_done=None):
+    # Use the rows of the data where both x and y are filled in
+    if not commit_data_grid():
+        return
+    x, y = data.valid()
 
     param_names = [entry_param_name.get() for entry_param_name in entries_param_name]
     params = [float(entry_param_value.get()) for entry_param_value in entries_param_value]
 
+    record = diagnostics.new_record("Fit")
     try:
-        # Get the formula entered by the user
-        formula = entry_formula.get()
-
-        # Create a string that can be evaluated by Python
-        string = "nonlinear_model = lambda x, {}: {}".format(", ".join(param_names), formula)
-        exec(string,globals())
+        # Turn the formula entered by the user into a python function and its jacobian
+        with record.stage("compile"):
+            nonlinear_model = compile_model(entry_formula.get(), param_names)
+            jacobian = compile_jacobian(entry_formula.get(), param_names)
     except Exception as e:
+        record.set(error=str(e))
         messagebox.showerror("Error", "Invalid formula or parameter names: {}".format(str(e)))
         return
 
-    try:
-        # Perform curve fitting
-        params, _ = curve_fit(nonlinear_model, x, y, p0=params)
-    except Exception as e:
-        messagebox.showerror("Error", "Curve fitting failed: {}".format(str(e)))
+    # The same fit of the same data was done before, show it again instead of fitting
+    from engine import LARGE_DATA_POINTS
+    coarse_to_fine = large_data_enabled.get() and len(x) > LARGE_DATA_POINTS
+    formula = entry_formula.get()
+    key = fit_key("coarse_to_fine" if coarse_to_fine else "fit", x, y, formula, param_names, params)
+    cached = fit_cache.get(key)
+    if cached is not None:
+        record.set(cache="hit")
+        with record.stage("plot"):
+            show_fit_result(cached, nonlinear_model, x, y, key)
+        if on_done is not None:
+            on_done()
         return
 
-    # Calculate R-squared
-    y_fit = nonlinear_model(x, *params)
-    r_squared = calculate_statistics(y, y_fit)["r_squared"]
-    std_err = calculate_statistics(y, y_fit)["std_err"]
-
-    # Calculate adjusted R-squared
-    n = len(x)
-    k = len(params)
-    adj_r_squared = calculate_adj_r_square(r_squared, n, k)
-
-    # Calculate p-value
-    slope, _, r_value, p_value, _ = linregress(y, y_fit)
-
-    # Update the plot with fitted curve and points
-    x_fit = np.linspace(min(x), max(x), 100)
-    y_fit = nonlinear_model(x_fit, *params)
-    line.set_data(x_fit, y_fit)
+    # Perform curve fitting and calculate the statistics of the fit, on the worker thread
+    def run(progress):
+        from engine import fit, coarse_to_fine_fit
+        fit_function = coarse_to_fine_fit if coarse_to_fine else fit
+        return fit_function(progress.wrap_model(nonlinear_model), x, y, params, param_names,
+                            progress.wrap_jac(jacobian), record=record)
+
+    def done(result):
+        fit_cache.put(key, result, formula)
+        with record.stage("plot"):
+            show_fit_result(result, nonlinear_model, x, y, key)
+        if on_done is not None:
+            on_done()
+
+    def failed(e):
+        messagebox.showerror("Error", "Curve fitting failed: {}".format(str(e)))
 
-    scatter.set_data(x, y)
+    worker.submit("Fit", tracked(record, run), done, failed)
+
+# Function to wrap a job, so it is tracked as its diagnostics record asks and its errors are kept in the record
+def tracked(record, function):
+    def run(progress):
+        try:
+            with record.track():
+                return function(progress)
+        except FitCancelled:
+            record.set(status="cancelled")
+            raise
+        except Exception as e:
+            record.set(error=str(e))
+            raise
+    return run
+
+# Function to show the results of a fit in the labels, the parameter entries and a plot
+# key is the key of the fit in the cache, it is saved with the project to show the fit when it is opened
+def show_fit_result(result, nonlinear_model, x, y, key=None):
+    global last_fit, last_fit_key
+    params = result["params"]
+    last_fit_key = key
+
+    # Keep the fit with everything the report needs, a cached fit knows the formula it was fitted with
+    last_fit = dict(result, formula=result.get("formula", entry_formula.get()), x=x, y=y, x_label=x_axis_label.get(), y_label=y_axis_label.get())
+
+    # Update the plot with fitted curve and points, the curve gets more points where it bends
+    plot = get_fit_plot()
+    from plotting import adaptive_grid
+    x_fit, y_fit = adaptive_grid(lambda x_grid: nonlinear_model(x_grid, *params), np.min(x), np.max(x))
+    plot.update(x, y, x_fit, y_fit, x_axis_label.get(), y_axis_label.get())
+
+    show_fit_statistics(result)
+    show_confidence_intervals(result.get("bootstrap"))
+
+# Function to show the bootstrap confidence intervals of the parameters, or nothing if there are none
+def show_confidence_intervals(bootstrap):
+    if bootstrap is None:
+        label_ci.config(text="Confidence Intervals: ")
+        return
+    intervals = ", ".join("{} [{:.4g}, {:.4g}]".format(name, low, high)
+                          for name, low, high in zip(bootstrap["param_names"], bootstrap["lower"], bootstrap["upper"]))
+    label_ci.config(text="{:.0f}% Confidence Intervals: {} ({} refits)".format(bootstrap["confidence"] * 100, intervals, bootstrap["refits"]))
+
+# Function to show the statistics and the fitted parameters of a fit in the labels and the entries
+# The entries are left alone if update_entries is False
+def show_fit_statistics(result, update_entries=True):
+    params = result["params"]
+    r_squared = result["r_squared"]
+    adj_r_squared = result["adj_r_squared"]
+    std_err = result["std_err"]
+    p_value = result["p_value"]
 
     # Update R-squared and p-value labels
     label_r_squared.config(text="R-squared: {:.4f}".format(r_squared))
@@ -76,132 +166,206 @@ def fit_model():
     label_params.config(text="Predicted Parameter Values: {}".format(param_values))
 
     # Update the predicted parameter values in the entries
-    for entry_param_value, param_value in zip(entries_param_value, params):
-        entry_param_value.delete(0, "end")
-        entry_param_value.insert(0, param_value)
-    
-    # Display the plot
-    plt.ion()
-    plt.show()
-    # Redraw the plot
-    ax.relim()
-    ax.autoscale_view()
-    plt.draw()
+    if update_entries:
+        for entry_param_value, param_value in zip(entries_param_value, params):
+            entry_param_value.delete(0, "end")
+            entry_param_value.insert(0, param_value)
+
+# Function to start a live fit a short while after the last edit, every new edit restarts the wait
+# It is bound to the key presses of the data, parameter and formula entries
+def schedule_live_fit(event=None):
+    global live_fit_timer
+    if not live_fit_enabled.get():
+        return
+    if live_fit_timer is not None:
+        root.after_cancel(live_fit_timer)
+    live_fit_timer = root.after(LIVE_FIT_DELAY, live_fit)
+
+# Function to refit in the background while the data and parameters are edited
+# Half typed values are skipped without an error, the statistics of the last fitted parameters on the
+# edited data are shown straight away, and the refit starts from the last fitted parameters
+def live_fit():
+    global live_fit_timer, live_fit_job
+    live_fit_timer = None
+    if not commit_data_grid(quiet=True):
+        return
+    x, y = data.valid()
+    formula = entry_formula.get()
+    param_names = [entry_param_name.get() for entry_param_name in entries_param_name]
+    try:
+        entry_params = [float(entry_param_value.get()) for entry_param_value in entries_param_value]
+        nonlinear_model = compile_model(formula, param_names)
+        jacobian = compile_jacobian(formula, param_names)
+    except Exception:
+        label_status.config(text="Live Fit: waiting for a valid formula and parameters")
+        return
+    if len(x) <= len(param_names):
+        return
 
-def bruteforce_params():
+    params = live_cache.start_params(formula, param_names, entry_params)
+    if live_cache.unchanged(formula, param_names, params, x, y):
+        return
+
+    # Show the statistics of the last fit on the edited data, only the edited points are evaluated again
+    preview = live_cache.preview(nonlinear_model, formula, param_names, x, y)
+    if preview is not None:
+        preview["params"] = live_cache.params
+        show_fit_statistics(preview, update_entries=False)
+
+    # A newer edit makes the running live fit useless, so cancel it
+    if live_fit_job is not None:
+        worker.cancel(live_fit_job)
+
+    def run(progress):
+        from engine import fit
+        result = fit(progress.wrap_model(nonlinear_model), x, y, params, param_names, progress.wrap_jac(jacobian))
+        return result, nonlinear_model(x, *result["params"])
+
+    def done(value):
+        global last_fit, last_fit_key
+        result, y_model = value
+        live_cache.store(formula, param_names, result["params"], x, y, y_model)
+        # Keep the live fit like any other fit, so the report, the SSE map and the project use what is shown
+        key = fit_key("fit", x, y, formula, param_names, params)
+        fit_cache.put(key, result, formula)
+        last_fit_key = key
+        last_fit = dict(result, formula=formula, x=x, y=y, x_label=x_axis_label.get(), y_label=y_axis_label.get())
+        # Only the line and the points are redrawn, unless they moved out of the axes
+        plot = get_fit_plot()
+        from plotting import adaptive_grid
+        x_fit, y_fit = adaptive_grid(lambda x_grid: nonlinear_model(x_grid, *result["params"]), np.min(x), np.max(x))
+        plot.update(x, y, x_fit, y_fit, x_axis_label.get(), y_axis_label.get())
+        # Do not overwrite a parameter the user is typing in
+        show_fit_statistics(result, update_entries=root.focus_get() not in entries_param_value)
+
+    live_fit_job = worker.submit("Live Fit", run, done)
+
+# Function to fit the model and get bootstrap confidence intervals of the fitted parameters
+# The data is resampled and refitted thousands of times on a pool of worker processes, starting from the fit
+def bootstrap_params():
+    if not commit_data_grid():
+        return
+    x, y = data.valid()
+    formula = entry_formula.get()
     param_names = [entry_param_name.get() for entry_param_name in entries_param_name]
-    params = [float(entry_param_value.get()) for entry_param_value in entries_param_value]
-    x = np.array([float(entry_x.get()) for entry_x in entries_x])
-    y = np.array([float(entry_y.get()) for entry_y in entries_y])
     try:
-        # Get the formula entered by the user
-        formula = entry_formula.get()
-        # Create a string that can be evaluated by Python
-        string = "nonlinear_model = lambda x, {}: {}".format(", ".join(param_names), formula)
-        exec(string,globals())
+        params = [float(entry_param_value.get()) for entry_param_value in entries_param_value]
+        nonlinear_model = compile_model(formula, param_names)
+        jacobian = compile_jacobian(formula, param_names)
     except Exception as e:
         messagebox.showerror("Error", "Invalid formula or parameter names: {}".format(str(e)))
         return
 
+    record = diagnostics.new_record("Bootstrap")
+    key = fit_key("bootstrap", x, y, formula, param_names, params, resamples=BOOTSTRAP_RESAMPLES)
+    cached = fit_cache.get(key)
+    if cached is not None:
+        record.set(cache="hit")
+        show_fit_result(cached, nonlinear_model, x, y, key)
+        return
+
+    def run(progress):
+        from engine import fit
+        from bootstrap import bootstrap_fit
+        result = fit(progress.wrap_model(nonlinear_model), x, y, params, param_names, progress.wrap_jac(jacobian), record)
+        result["bootstrap"] = bootstrap_fit(formula, param_names, x, y, result["params"], BOOTSTRAP_RESAMPLES,
+                                            time_budget=BOOTSTRAP_TIME, record=record, callback=progress.report)
+        return result
+
+    def done(result):
+        fit_cache.put(key, result, formula)
+        with record.stage("plot"):
+            show_fit_result(result, nonlinear_model, x, y, key)
+
+    def failed(e):
+        messagebox.showerror("Error", "Bootstrap failed: {}".format(str(e)))
+
+    worker.submit("Bootstrap", tracked(record, run), done, failed)
+
+# Function to get the lower and upper bounds of the parameters, an empty box means no bound (inf)
+# It returns None, None when no bounds were entered at all
+# The brute force search fills the empty boxes from its default search range to spread its starting
+# points, but only the entered bounds limit the fits
+def get_param_bounds():
+    lower = [float(entry.get()) if entry.get().strip() else -np.inf for entry in entries_param_lower]
+    upper = [float(entry.get()) if entry.get().strip() else np.inf for entry in entries_param_upper]
+    if all(np.isinf(lower)) and all(np.isinf(upper)):
+        return None, None
+    return np.array(lower), np.array(upper)
+
+def bruteforce_params():
+    param_names = [entry_param_name.get() for entry_param_name in entries_param_name]
+    params = [float(entry_param_value.get()) for entry_param_value in entries_param_value]
+    # Use the rows of the data where both x and y are filled in
+    if not commit_data_grid():
+        return
+    x, y = data.valid()
     try:
-        # Perform curve fitting
-        params, _ = curve_fit(nonlinear_model, x, y, p0=params)
+        # Check the formula entered by the user
+        compile_model(entry_formula.get(), param_names)
+        lower, upper = get_param_bounds()
+        starts = int(entry_starts.get())
     except Exception as e:
-        messagebox.showerror("Error", "Curve fitting failed: {}".format(str(e)))
+        messagebox.showerror("Error", "Invalid formula, parameters or bounds: {}".format(str(e)))
         return
-    tup = bruteforce_fit(nonlinear_model,x,y,params)
-    # Update the predicted parameter values label and entries
-    param_values = ", ".join("{:.4f}".format(value) for value in tup[1])
-    label_params.config(text="Predicted Parameter Values: {}".format(param_values))
-    for entry_param_value, param_value in zip(entries_param_value, tup[1]):
-        entry_param_value.delete(0, "end")
-        entry_param_value.insert(0, param_value)
-    # Now perform the fit with the new parameters
-    fit_model()
+
+    # Start curve_fit from many points within the bounds and keep the best fit, on the worker thread
+    formula = entry_formula.get()
+
+    record = diagnostics.new_record("Brute Force")
+
+    def use_params(best_params):
+        # Update the predicted parameter values label and entries
+        param_values = ", ".join("{:.4f}".format(value) for value in best_params)
+        label_params.config(text="Predicted Parameter Values: {}".format(param_values))
+        for entry_param_value, param_value in zip(entries_param_value, best_params):
+            entry_param_value.delete(0, "end")
+            entry_param_value.insert(0, param_value)
+        # Now perform the fit with the new parameters
+        fit_model()
+
+    # The same search was done before, start from the parameters it found
+    key = fit_key("bruteforce", x, y, formula, param_names, params, lower, upper, starts=starts)
+    cached = fit_cache.get(key)
+    if cached is not None:
+        record.set(cache="hit")
+        use_params(cached["params"])
+        return
+
+    def run(progress):
+        from functions import bruteforce_fit
+        return bruteforce_fit(formula, param_names, x, y, params, lower, upper, starts=starts,
+                              callback=progress.report, record=record)
+
+    def done(tup):
+        fit_cache.put(key, {"params": [float(value) for value in tup[1]]}, formula)
+        use_params(tup[1])
+
+    def failed(e):
+        messagebox.showerror("Error", "Curve fitting failed: {}".format(str(e)))
+
+    worker.submit("Brute Force", tracked(record, run), done, failed)
 
 
 # Function to generate a report of the model, including the formula, R-squared, p-value, and predicted parameter values
-# It generates an HTML file and opens it in the default web browser
+# It generates an HTML file from the last fit and opens it in the default web browser
 def generate_report():
-    # Check if there is already a plot
-    if len(plt.get_fignums()) == 0:
-        fit_model()
+    # Check if there is already a fit, if not fit the model first and make the report when it is done
+    if last_fit is None:
+        fit_model(on_done=generate_report)
+        return
 
-    # Make a variable with the name of each parameter and it's value in the format of "name = value"
-    param_names = [entry_param_name.get() for entry_param_name in entries_param_name]
-    params = [float(entry_param_value.get()) for entry_param_value in entries_param_value]
-    param_values = ", ".join("{} = {:.4f}".format(name, value) for name, value in zip(param_names, params))
+    # Draw the plot and write the report on the worker thread, then open it
+    fit_result = last_fit
+    record = diagnostics.new_record("Report")
 
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format="png")
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.read()).decode("utf-8")
+    def run(progress):
+        from report import write_report
+        return write_report([fit_result], "report.html", workers=1, record=record)
 
-    formula = entry_formula.get()
-    formula = formula.replace("^", "**")
-    if x_axis_label.get() != "":
-        # Check the occourance of x in the formula, where it is not a part of another variable name
-        # For example, if the formula is "a*x + b", then it should be replaced with "a*<x-axis-label> + b"
-        # But if the formula is "ax + b", then it should not be replaced
-        # So, we check if the character before and after x is a letter or not
-        # If it is a letter, then it is a part of another variable name, so it should not be replaced
-        # If it is not a letter, then it is not a part of another variable name, so it should be replaced
-        formula = re.sub(r"(?<![a-zA-Z])x(?![a-zA-Z])", x_axis_label.get(), formula)
-    
-    # Create the HTML report
-    report = f"""
-    <html>
-        <head>
-        <style>
-            table, th, td {{
-            border: 1px solid black;
-            border-collapse: collapse;
-            }}
-            th, td {{
-            padding: 15px;
-            }}
-        </style>
-            <title>Model Report</title>
-        </head>
-        <body>
-            <h1>Model Report</h1>
-            <img src="data:image/png;base64,{image_base64}" />
-            <table>
-                <tr>
-                    <th>Formula</th>
-                    <td>{formula}</td>
-                </tr>
-                <tr>
-                    <th>R-squared</th>
-                    <td>{label_r_squared["text"].split(" ")[1]}</td>
-                </tr>
-                <tr>
-                    <th>Adjusted R-squared</th>
-                    <td>{label_adjusted_r_squared["text"].split(" ")[2]}</td>
-                </tr>
-                <tr>
-                    <th>p-value</th>
-                    <td>{label_p_value["text"].split(" ")[1]}</td>
-                </tr>
-                <tr>
-                    <th>Standard Error</th>
-                    <td>{label_std_err["text"].split(" ")[2]}</td>
-                </tr>
-                <tr>
-                    <th>Predicted Parameter Values</th>
-                    <td>{param_values}</td>
-                </tr>
-            </table>
-        </body>
-    </html>
-    """
-
-    # Write the report to a file
-    with open("report.html", "w") as file:
-        file.write(report)
-
-    # Open the report in the default web browser
-    webbrowser.open("report.html")
+    worker.submit("Report", tracked(record, run),
+                  lambda file_path: webbrowser.open(file_path),
+                  lambda e: messagebox.showerror("Error", "Generating the report failed: {}".format(str(e))))
 
 
 
@@ -215,60 +379,116 @@ def add_data_points_from_file():
     if file_path:
         # Clear the current data points
         clear_data_points()
-        # Open the file in read mode
-        with open(file_path, "r", encoding="UTF-8") as file:
-            # Read the file contents and split them by newline
-            lines = file.read().split("\n")
-
-            # If the first line contains anything other than a number, or dot then it is the header
-            if not re.match(r"^\d+\.?\d*$", lines[0].split(",")[0]) or not re.match(r"^\d+\.?\d*$", lines[0].split(",")[1]):
-                # Add the x and y axis labels
-                x_axis_label.insert(0, lines[0].split(",")[0])
-                y_axis_label.insert(0, lines[0].split(",")[1])
-                # then remove the header from the list of lines
-                lines.pop(0)
-
-            # Add a data point for each line
-            for line in lines:
-                # Split the line by comma
-                x, y = line.split(",")
-
-                # Add a data point
-                add_data_point()
-
-                # Set the x and y values of the last data point
-                entries_x[-1].insert(0, x)
-                entries_y[-1].insert(0, y)
+        # Read the whole file into the data arrays at once, the header becomes the axis labels
+        try:
+            data.load(file_path)
+        except Exception as e:
+            messagebox.showerror("Error", "Could not read the data file: {}".format(str(e)))
+            refresh_data_grid()
+            return
+        x_axis_label.insert(0, data.x_label)
+        y_axis_label.insert(0, data.y_label)
+        refresh_data_grid()
 
 # Function to save data points to a file
 def save_data_points_to_file():
+    if not commit_data_grid():
+        return
     # Make a "Save" window appear and store the chosen file path as a string
     file_path = filedialog.asksaveasfilename()
 
     # If the user chose a file
     if file_path:
-        # Open the file in write mode
-        with open(file_path, "w",encoding="UTF-8") as file:
-            # Write each data point to the file
-            for point in points:
-                file.write("{},{}\n".format(point[0].get(), point[1].get()))
+        # Write the data points to the file, with the axis labels as the header
+        data.x_label = x_axis_label.get()
+        data.y_label = y_axis_label.get()
+        data.save(file_path)
 
 
 
 # function to clear the current data points
 def clear_data_points():
+    global first_visible_row
     # Remove the x-label and y-labels
     x_axis_label.delete(0,"end")
     y_axis_label.delete(0,"end")
-    # Remove all data points from the list
-    for point in points:
-        point[0].destroy()
-        point[1].destroy()
-
-    # Remove all data points from the list
-    points.clear()
-    entries_x.clear()
-    entries_y.clear()
+    # Remove all data points
+    data.clear()
+    first_visible_row = 0
+    refresh_data_grid()
+
+# Function to format a value for an entry box, empty cells are stored as nan
+def format_value(value):
+    if not np.isfinite(value):
+        return ""
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+# Function to show the rows of the data that are visible in the entry boxes of the grid
+# The grid only has entry boxes for VISIBLE_ROWS rows, no matter how many data points there are
+def refresh_data_grid():
+    global first_visible_row
+    first_visible_row = max(0, min(first_visible_row, len(data) - VISIBLE_ROWS))
+    for i, (label_row, entry_x, entry_y) in enumerate(grid_rows):
+        row = first_visible_row + i
+        if row < len(data):
+            label_row.config(text=str(row + 1))
+            for entry, value in ((entry_x, data.x[row]), (entry_y, data.y[row])):
+                entry.delete(0, "end")
+                entry.insert(0, format_value(value))
+                entry.grid()
+            label_row.grid()
+        else:
+            for widget in (label_row, entry_x, entry_y):
+                widget.grid_remove()
+
+    # Update the size and position of the scrollbar
+    if len(data) > VISIBLE_ROWS:
+        data_scrollbar.set(first_visible_row / len(data), (first_visible_row + VISIBLE_ROWS) / len(data))
+    else:
+        data_scrollbar.set(0, 1)
+
+# Function to store the values typed into the visible entry boxes in the data
+# It returns False and shows an error if one of them is not a number
+# If quiet is True the values that are not numbers are skipped without an error
+def commit_data_grid(event=None, quiet=False):
+    for i, (label_row, entry_x, entry_y) in enumerate(grid_rows):
+        row = first_visible_row + i
+        if row >= len(data):
+            break
+        for column, entry in enumerate((entry_x, entry_y)):
+            text = entry.get().strip()
+            current = data.x[row] if column == 0 else data.y[row]
+            if text == format_value(current):
+                continue
+            try:
+                value = float(text) if text else np.nan
+            except ValueError:
+                if not quiet:
+                    messagebox.showerror("Error", "Row {}: '{}' is not a number".format(row + 1, text))
+                return False
+            data.set_value(row, column, value)
+    return True
+
+# Function to scroll the grid, it is called by the scrollbar and the mouse wheel
+def scroll_data(*args):
+    global first_visible_row
+    if not commit_data_grid():
+        return
+    if args[0] == "moveto":
+        first_visible_row = int(float(args[1]) * len(data))
+    elif args[0] == "scroll":
+        step = VISIBLE_ROWS if args[2] == "pages" else 1
+        first_visible_row += int(args[1]) * step
+    refresh_data_grid()
+
+# Function to scroll the grid with the mouse wheel
+def scroll_data_wheel(event):
+    if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+        scroll_data("scroll", -3, "units")
+    else:
+        scroll_data("scroll", 3, "units")
 
 # Function to save the model to a file, so that it can be loaded later, without having to re-enter the formula
 # If the user has not entered a formula, an error message will be displayed
@@ -288,9 +508,12 @@ def save_model():
             # Write the formula to the file
             file.write("{}\n".format(entry_formula.get()))
 
-            # Write the parameter names and values to the file
-            for param_name, param_value in zip(entries_param_name, entries_param_value):
-                file.write("{},{}\n".format(param_name.get(), param_value.get()))
+            # Write the parameter names and values to the file, followed by the bounds if there are any
+            for param_name, param_value, param_lower, param_upper in zip(entries_param_name, entries_param_value, entries_param_lower, entries_param_upper):
+                if param_lower.get() or param_upper.get():
+                    file.write("{},{},{},{}\n".format(param_name.get(), param_value.get(), param_lower.get(), param_upper.get()))
+                else:
+                    file.write("{},{}\n".format(param_name.get(), param_value.get()))
 
 # Function to load a model from a file
 def load_model():
@@ -299,68 +522,388 @@ def load_model():
 
     # If the user chose a file
     if file_path:
-        # Clear the current parameter points
-        clear_param_points()
+        load_model_from_file(file_path)
+
+# Function to put the formula and parameters of a model file into the entry boxes
+# If fitted parameter values are given, they replace the initial values from the file
+def load_model_from_file(file_path, fitted_params=None):
+    # Open the file in read mode
+    with open(file_path, "r", encoding="UTF-8") as file:
+        # Read the file contents and split them by newline
+        lines = file.read().split("\n")
+
+    # Make a row for each parameter line, skipping empty lines
+    param_rows = []
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+        # Split the line by comma, the bounds in the third and fourth columns are optional
+        values = line.split(",")
+        param_name, param_value = values[0], values[1]
+        param_lower = values[2] if len(values) > 2 else ""
+        param_upper = values[3] if len(values) > 3 else ""
+        if fitted_params is not None:
+            param_value = fitted_params[len(param_rows)]
+        param_rows.append([param_name, param_value, param_lower, param_upper])
+
+    set_model(lines[0], param_rows)
+
+# Function to put a formula and its parameters into the entry boxes
+# Every row of param_rows is the name, value, lower bound and upper bound of a parameter
+def set_model(formula, param_rows):
+    # Clear the current parameter points
+    clear_param_points()
+
+    # Set the formula
+    entry_formula.delete(0, "end")
+    entry_formula.insert(0, formula)
+
+    for param_name, param_value, param_lower, param_upper in param_rows:
+        # Add a parameter point
+        add_param_point()
+
+        # Set the name, value and bounds of the last parameter point
+        entries_param_name[-1].insert(0, param_name)
+        entries_param_value[-1].insert(0, param_value)
+        entries_param_lower[-1].insert(0, param_lower)
+        entries_param_upper[-1].insert(0, param_upper)
+
+# Function to get the parameters in the entry boxes as rows of name, value, lower bound and upper bound
+def get_param_rows():
+    return [[param_name.get(), param_value.get(), param_lower.get(), param_upper.get()] for param_name, param_value, param_lower, param_upper
+            in zip(entries_param_name, entries_param_value, entries_param_lower, entries_param_upper)]
+
+# Function to save the data, the model and every fit of the session into one project file
+def save_project_file():
+    if not commit_data_grid():
+        return
+    file_path = filedialog.asksaveasfilename(defaultextension=".npz", filetypes=[("Project Files", "*.npz")], initialfile="project.npz")
+    if not file_path:
+        return
+    project = {
+        "datasets": [{"name": "data", "x": data.x, "y": data.y, "x_label": x_axis_label.get(), "y_label": y_axis_label.get()}],
+        "model": {"formula": entry_formula.get(), "params": get_param_rows()},
+        "fits": fit_cache,
+        "last_fit": last_fit_key,
+    }
+    try:
+        save_project(file_path, project)
+    except Exception as e:
+        messagebox.showerror("Error", "Could not save the project: {}".format(str(e)))
 
-        # Open the file in read mode
-        with open(file_path, "r", encoding="UTF-8") as file:
-            # Read the file contents and split them by newline
-            lines = file.read().split("\n")
+# Function to open a project file, the fits in it are cached, so they are not fitted again
+# The fit that was shown when the project was saved is shown again
+def open_project_file():
+    file_path = filedialog.askopenfilename(filetypes=[("Project Files", "*.npz")])
+    if not file_path:
+        return
+    try:
+        project = load_project(file_path)
+    except Exception as e:
+        messagebox.showerror("Error", "Could not open the project: {}".format(str(e)))
+        return
 
-            # Set the formula
-            # Get the length of the formula
-            formula_length = len(entry_formula.get())
-            entry_formula.delete(0, formula_length)
-            entry_formula.insert(0, lines[0])
+    clear_data_points()
+    if project["datasets"]:
+        dataset = project["datasets"][0]
+        data.x, data.y = np.array(dataset["x"], dtype=float), np.array(dataset["y"], dtype=float)
+        x_axis_label.insert(0, dataset["x_label"])
+        y_axis_label.insert(0, dataset["y_label"])
+        refresh_data_grid()
+    if project["model"]:
+        set_model(project["model"]["formula"], project["model"]["params"])
+    for key, result in project["fits"].items():
+        fit_cache.put(key, result)
+
+    # The fit is shown with the formula it was fitted with, projects saved before fits kept their formula
+    # do not show it
+    key = project["last_fit"]
+    if key in fit_cache and "param_names" in fit_cache.fits[key] and "formula" in fit_cache.fits[key]:
+        result = fit_cache.get(key)
+        x, y = data.valid()
+        show_fit_result(result, compile_model(result["formula"], result["param_names"]), x, y, key)
+
+# Function to fit every model in the models folder to the data and show them ranked in a new window
+# Double clicking a model loads it with its fitted parameters
+def compare_models_window():
+    from compare import compare_models, list_model_files
+    if not commit_data_grid():
+        return
+    x, y = data.valid()
+    model_paths = list_model_files()
+    if not model_paths:
+        messagebox.showerror("Error", "There are no model files in the models folder")
+        return
 
-            # Add a parameter point for each line
-            for line in lines[1:]:
-                # Split the line by comma
-                param_name, param_value = line.split(",")
+    # Fit the models on the worker thread and show the table when they are done
+    def failed(e):
+        messagebox.showerror("Error", "Comparing the models failed: {}".format(str(e)))
+
+    def run(progress):
+        return compare_models(model_paths, x, y, callback=progress.report)
+
+    worker.submit("Compare Models", run, show_comparison, failed)
+
+# Function to show the ranked models in a new window
+def show_comparison(results):
+    window = Toplevel(root)
+    window.title("Compare Models")
+    columns = ("rank", "model", "adj_r_squared", "r_squared", "aic", "bic", "sse", "fit_time", "params")
+    headings = ("Rank", "Model", "Adjusted R-squared", "R-squared", "AIC", "BIC", "SSE", "Fit Time (ms)", "Parameters / Error")
+    table = ttk.Treeview(window, columns=columns, show="headings", height=min(20, len(results)))
+    for column, heading in zip(columns, headings):
+        table.heading(column, text=heading)
+        table.column(column, width=260 if column == "params" else 110, anchor="center")
+    table.grid(row=0, column=0, padx=5, pady=5)
+
+    for rank, result in enumerate(results, 1):
+        if result["error"]:
+            values = (rank, result["model"], "", "", "", "", "", "{:.1f}".format(result["fit_time"] * 1000), result["error"])
+        else:
+            param_values = ", ".join("{} = {:.4g}".format(name, value) for name, value in zip(result["param_names"], result["params"]))
+            values = (rank, result["model"], "{:.4f}".format(result["adj_r_squared"]), "{:.4f}".format(result["r_squared"]),
+                      "{:.4f}".format(result["aic"]), "{:.4f}".format(result["bic"]), "{:.6g}".format(result["sse"]),
+                      "{:.1f}".format(result["fit_time"] * 1000), param_values)
+        table.insert("", "end", iid=str(rank - 1), values=values)
+
+    def use_model(event):
+        selection = table.selection()
+        if not selection:
+            return
+        result = results[int(selection[0])]
+        if result["error"]:
+            return
+        load_model_from_file(result["path"], result["params"])
+        fit_model()
 
-                # Add a parameter point
-                add_param_point()
+    table.bind("<Double-1>", use_model)
 
-                # Set the name and value of the last parameter point
-                entries_param_name[-1].insert(0, param_name)
-                entries_param_value[-1].insert(0, param_value)
+# Function to fit the formula to several data files at once, with some parameters shared by all of them
+# The files are chosen first, then every parameter is marked as shared or local in a new window
+def global_fit_window():
+    file_paths = filedialog.askopenfilenames(filetypes=[("CSV Files", "*.csv")], title="Choose the data files")
+    if not file_paths:
+        return
+    formula = entry_formula.get()
+    param_names = [entry_param_name.get() for entry_param_name in entries_param_name]
+    try:
+        params = [float(entry_param_value.get()) for entry_param_value in entries_param_value]
+        compile_model(formula, param_names)
+        lower, upper = get_param_bounds()
+    except Exception as e:
+        messagebox.showerror("Error", "Invalid formula, parameters or bounds: {}".format(str(e)))
+        return
+
+    window = Toplevel(root)
+    window.title("Global Fit")
+
+    # A check box for every parameter, a ticked parameter has one value for all the files
+    shared_vars = []
+    for index, param_name in enumerate(param_names):
+        shared_var = BooleanVar(window, value=False)
+        Checkbutton(window, text="{} shared".format(param_name), variable=shared_var).grid(row=0, column=index, padx=5, pady=5)
+        shared_vars.append(shared_var)
+
+    columns = ("file", "r_squared", "sse", "params")
+    headings = ("Data", "R-squared", "SSE", "Parameters")
+    table = ttk.Treeview(window, columns=columns, show="headings", height=min(20, len(file_paths)))
+    for column, heading in zip(columns, headings):
+        table.heading(column, text=heading)
+        table.column(column, width=320 if column == "params" else 140, anchor="center")
+    table.grid(row=1, column=0, columnspan=max(2, len(param_names) + 1), padx=5, pady=5)
+    label_global = Label(window, text="{} files".format(len(file_paths)))
+    label_global.grid(row=2, column=1, columnspan=max(1, len(param_names)), padx=5, pady=5, sticky="W")
+
+    def show(result):
+        table.delete(*table.get_children())
+        for index, dataset in enumerate(result["datasets"]):
+            param_values = ", ".join("{} = {:.4g}".format(name, value) for name, value in zip(dataset["param_names"], dataset["params"]))
+            table.insert("", "end", iid=str(index), values=(dataset["file"], "{:.4f}".format(dataset["r_squared"]),
+                                                           "{:.6g}".format(dataset["sse"]), param_values))
+        label_global.config(text="{} files, {} parameters, R-squared: {:.4f}, SSE: {:.6g}".format(
+            len(result["datasets"]), result["k"], result["r_squared"], result["sse"]))
+
+    def failed(e):
+        messagebox.showerror("Error", "Global fit failed: {}".format(str(e)))
+
+    # Fit all the files as one problem on the worker thread
+    def fit_all():
+        shared = [shared_var.get() for shared_var in shared_vars]
+        record = diagnostics.new_record("Global Fit")
+
+        def run(progress):
+            from global_fit import global_fit_files
+            return global_fit_files(formula, param_names, params, file_paths, shared, lower, upper, record)
+
+        worker.submit("Global Fit", tracked(record, run), show, failed)
+
+    Button(window, text="Fit", command=fit_all).grid(row=2, column=0, padx=5, pady=5)
+
+# Function to show a map of the sum of squared errors around the last fit, for two of its parameters
+# The other parameters are held at their fitted values. The map of the fit is added to its report.
+def sse_map_window():
+    if last_fit is None:
+        fit_model(on_done=sse_map_window)
+        return
+    fit_result = last_fit
+    param_names = list(fit_result["param_names"])
+    if len(param_names) < 2:
+        messagebox.showerror("Error", "The model needs at least two parameters for a map")
+        return
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from plotting import draw_landscape
+    from landscape import GRID_POINTS
+
+    window = Toplevel(root)
+    window.title("SSE Map")
+    first_box = ttk.Combobox(window, values=param_names, state="readonly")
+    first_box.grid(row=0, column=0, padx=5, pady=5)
+    first_box.current(0)
+    second_box = ttk.Combobox(window, values=param_names, state="readonly")
+    second_box.grid(row=0, column=1, padx=5, pady=5)
+    second_box.current(1)
+    Label(window, text="Grid Points: ").grid(row=0, column=2, padx=5, pady=5, sticky="E")
+    entry_points = Entry(window)
+    entry_points.grid(row=0, column=3, padx=5, pady=5)
+    entry_points.insert(0, str(GRID_POINTS))
+    label_map = Label(window, text="")
+    label_map.grid(row=2, column=0, columnspan=5, padx=5, pady=5, sticky="W")
+
+    figure = Figure(figsize=(6, 4.5), dpi=100)
+    canvas = FigureCanvasTkAgg(figure, master=window)
+    canvas.get_tk_widget().grid(row=1, column=0, columnspan=5, padx=5, pady=5)
+
+    def show(landscape):
+        figure.clear()
+        draw_landscape(figure, landscape)
+        canvas.draw()
+        label_map.config(text="Lowest SSE on the map: {:.6g}, fitted SSE: {:.6g}, computed in {:.0f} ms".format(
+            landscape["sse_min"], fit_result["sse"], landscape["time"] * 1000))
+        if landscape["points"] < len(fit_result["x"]):
+            label_map.config(text=label_map["text"] + " on {} of {} points".format(landscape["points"], len(fit_result["x"])))
+        # The report of this fit shows the last map drawn for it
+        fit_result["landscape"] = landscape
+
+    def failed(e):
+        messagebox.showerror("Error", "Computing the map failed: {}".format(str(e)))
+
+    # Evaluate the model over the grid on the worker thread
+    def draw_map():
+        first, second = first_box.current(), second_box.current()
+        try:
+            points = int(entry_points.get())
+        except ValueError:
+            messagebox.showerror("Error", "The number of grid points has to be a whole number")
+            return
+        if first == second:
+            messagebox.showerror("Error", "Choose two different parameters")
+            return
+        record = diagnostics.new_record("SSE Map")
+
+        def run(progress):
+            from landscape import sse_landscape
+            model = compile_model(fit_result["formula"], param_names)
+            return sse_landscape(model, fit_result["x"], fit_result["y"], fit_result["params"], first, second,
+                                 param_names, points=points, param_std_err=fit_result.get("param_std_err"),
+                                 record=record, callback=progress.report)
+
+        worker.submit("SSE Map", tracked(record, run), show, failed)
+
+    Button(window, text="Draw", command=draw_map).grid(row=0, column=4, padx=5, pady=5)
+    draw_map()
+
+# Function to show the diagnostics of the last jobs in a new window, where the time of every job went
+# Double clicking a job shows its cProfile capture, if it was profiled
+def diagnostics_window():
+    window = Toplevel(root)
+    window.title("Diagnostics")
+    columns = ("job", "wall_time", "stages", "nfev", "status", "memory", "profile")
+    headings = ("Job", "Wall Time (ms)", "Stages (ms)", "Evaluations", "Status", "Peak Memory (MB)", "Profile")
+    table = ttk.Treeview(window, columns=columns, show="headings", height=15)
+    for column, heading in zip(columns, headings):
+        table.heading(column, text=heading)
+        table.column(column, width=320 if column in ("stages", "status") else 100, anchor="center")
+    table.grid(row=0, column=0, columnspan=6, padx=5, pady=5)
+
+    profile_next = BooleanVar(window, value=diagnostics.profile_next)
+    track_memory = BooleanVar(window, value=diagnostics.track_memory)
+
+    def refresh():
+        table.delete(*table.get_children())
+        for record in reversed(diagnostics.records):
+            stages = ", ".join("{} {:.1f}".format(name, seconds * 1000) for name, seconds in record.stage_times().items())
+            info = record.info
+            status = info.get("error") or info.get("message") or info.get("status", "")
+            memory = "" if record.peak_memory is None else "{:.2f}".format(record.peak_memory / 2 ** 20)
+            table.insert("", "end", iid=str(record.record_id),
+                         values=("{} {}".format(record.name, record.record_id), "{:.1f}".format(record.wall_time() * 1000),
+                                 stages, info.get("nfev", ""), status, memory, "yes" if record.profile else ""))
+        profile_next.set(diagnostics.profile_next)
+
+    def export(to_file, extension, title):
+        file_path = filedialog.asksaveasfilename(defaultextension=extension, filetypes=[("JSON Files", "*.json")], title=title)
+        if file_path:
+            to_file(file_path)
+
+    def show_profile(event):
+        selection = table.selection()
+        if not selection:
+            return
+        record = next((record for record in diagnostics.records if str(record.record_id) == selection[0]), None)
+        if record is None or not record.profile:
+            messagebox.showinfo("Profile", "This job was not profiled, tick profile next job and run it again")
+            return
+        profile_window = Toplevel(window)
+        profile_window.title("Profile of {} {}".format(record.name, record.record_id))
+        text = Text(profile_window, width=140, height=40)
+        text.insert("end", record.profile)
+        text.grid(row=0, column=0)
+
+    def set_profile_next():
+        diagnostics.profile_next = profile_next.get()
+
+    def set_track_memory():
+        diagnostics.track_memory = track_memory.get()
+
+    table.bind("<Double-1>", show_profile)
+    Button(window, text="Refresh", command=refresh).grid(row=1, column=0, padx=5, pady=5)
+    Button(window, text="Export JSON", command=lambda: export(diagnostics.to_json, ".json", "Export Diagnostics")).grid(row=1, column=1, padx=5, pady=5)
+    Button(window, text="Export Chrome Trace", command=lambda: export(diagnostics.to_chrome_trace, ".json", "Export Chrome Trace")).grid(row=1, column=2, padx=5, pady=5)
+    Button(window, text="Clear", command=lambda: (diagnostics.clear(), refresh())).grid(row=1, column=3, padx=5, pady=5)
+    Checkbutton(window, text="Profile Next Job", variable=profile_next, command=set_profile_next).grid(row=1, column=4, padx=5, pady=5)
+    Checkbutton(window, text="Track Memory", variable=track_memory, command=set_track_memory).grid(row=1, column=5, padx=5, pady=5)
+    refresh()
 
 # Function to clear the current parameter points
 def clear_param_points():
-    labels_param_name.pop().destroy()
-    entries_param_name.pop().destroy()
-    labels_param_value.pop().destroy()
-    entries_param_value.pop().destroy()
     # Remove all parameter points from the list
-    for param_point in entries_param_value:
+    while labels_param_name:
         labels_param_name.pop().destroy()
         entries_param_name.pop().destroy()
         labels_param_value.pop().destroy()
         entries_param_value.pop().destroy()
+        entries_param_lower.pop().destroy()
+        entries_param_upper.pop().destroy()
 
 # Function to add a new data point
 def add_data_point():
-    entry_x = Entry(frame)
-    entry_x.grid(row=len(points) + 4, column=1, padx=5, pady=5)
-
-    entry_y = Entry(frame)
-    entry_y.grid(row=len(points) + 4, column=2, padx=5, pady=5)
-
-    entries_x.append(entry_x)
-    entries_y.append(entry_y)
-
-    points.append((entry_x, entry_y))
+    global first_visible_row
+    if not commit_data_grid():
+        return
+    data.add_rows(1)
+    # Scroll to the end, so the new row is visible
+    first_visible_row = len(data) - VISIBLE_ROWS
+    refresh_data_grid()
 
 
 # Function to remove the last data point
 def remove_data_point():
-    if len(points) > 2:
-        last_point = points.pop()
-        last_point[0].destroy()
-        last_point[1].destroy()
-
-        entries_x.remove(last_point[0])
-        entries_y.remove(last_point[1])
+    if len(data) > 2:
+        commit_data_grid()
+        data.remove_last()
+        refresh_data_grid()
 
 def add_param_point():
     i = len(labels_param_name)
@@ -378,7 +921,17 @@ def add_param_point():
     labels_param_value.append(label_param_value)
     entries_param_value.append(entry_param_value)
 
-    
+    # Refit in live mode when the name or value of the parameter is edited
+    entry_param_name.bind("<KeyRelease>", schedule_live_fit)
+    entry_param_value.bind("<KeyRelease>", schedule_live_fit)
+
+    # The bounds are optional, they set the range the brute force search starts from
+    entry_param_lower = Entry(root, width=10)
+    entry_param_lower.grid(row=i + 2, column=7, padx=5, pady=5)
+    entries_param_lower.append(entry_param_lower)
+    entry_param_upper = Entry(root, width=10)
+    entry_param_upper.grid(row=i + 2, column=8, padx=5, pady=5)
+    entries_param_upper.append(entry_param_upper)
 
 def remove_param_point():
     if len(labels_param_name) > 1:
@@ -386,137 +939,269 @@ def remove_param_point():
         entries_param_name.pop().destroy()
         labels_param_value.pop().destroy()
         entries_param_value.pop().destroy()
-
-# Create a GUI window
-root = Tk()
-root.title("Nonlinear Model Fitting")
-root.resizable(False, False)
-
-# Create a frame for the data points
-frame = Frame(root)
-frame.grid(row=0, columnspan=3)
-
-# Create a label and entry box for the the x-axis label and the y-axis label of the graph
-label_x = Label(frame, text="X-Axis Label")
-label_x.grid(row=1, column=1, padx=5, pady=5)
-x_axis_label = Entry(frame)
-x_axis_label.grid(row=2, column=1, padx=5, pady=5)
-
-label_y = Label(frame, text="Y-Axis Label")
-label_y.grid(row=1, column=2, padx=5, pady=5)
-y_axis_label = Entry(frame)
-y_axis_label.grid(row=2, column=2, padx=5, pady=5)
-
-# Create a label for the x and y data points
-label_data_points = Label(frame, text="X Data")
-label_data_points.grid(row=3, column=1, padx=5, pady=5)
-label_data_points = Label(frame, text="Y Data")
-label_data_points.grid(row=3, column=2, padx=5, pady=5)
-
-
-# Create labels and entry boxes for the initial two data points
-labels_x = []
-entries_x = []
-labels_y = []
-entries_y = []
-points = []
-for i in range(3,5):
-    entry_x = Entry(frame)
-    entry_y = Entry(frame)
-
-    entry_x.grid(row=i + 1, column=1, padx=5, pady=5)
-    entry_y.grid(row=i + 1, column=2, padx=5, pady=5)
-
-    entries_x.append(entry_x)
-    entries_y.append(entry_y)
-
-    points.append((entry_x, entry_y))
-
-# Create buttons for adding and removing data points
-add_button = Button(root, text="Add Data Point", command=add_data_point)
-add_button.grid(row=1, column=0, padx=5, pady=10)
-
-remove_button = Button(root, text="Remove Last Point", command=remove_data_point)
-remove_button.grid(row=1, column=1, padx=5, pady=10)
-
-add_button_param = Button(root, text="Add Params", command=add_param_point)
-add_button_param.grid(row=2, column=0, padx=5, pady=10)
-
-remove_button_param = Button(root, text="Remove Param", command=remove_param_point)
-remove_button_param.grid(row=2, column=1, padx=5, pady=10)
-
-# Create labels and entry boxes for the parameters
-labels_param_name = []
-entries_param_name = []
-labels_param_value = []
-entries_param_value = []
-params = []
-for i in range(2):
-    label_param_name = Label(root, text="Parameter Name {}".format(i + 1))
-    label_param_name.grid(row=i + 2, column=3, padx=5, pady=5, sticky="E")
-    entry_param_name = Entry(root)
-    entry_param_name.grid(row=i + 2, column=4, padx=5, pady=5)
-    labels_param_name.append(label_param_name)
-    entries_param_name.append(entry_param_name)
-
-    label_param_value = Label(root, text="Parameter Value {}".format(i + 1))
-    label_param_value.grid(row=i + 2, column=5, padx=5, pady=5, sticky="E")
-    entry_param_value = Entry(root)
-    entry_param_value.grid(row=i + 2, column=6, padx=5, pady=5)
-    labels_param_value.append(label_param_value)
-    entries_param_value.append(entry_param_value)
-
-# Create a label and entry box for the formula
-label_formula = Label(root, text="Formula: ")
-label_formula.grid(row=1, column=3, padx=5, pady=10, sticky="E")
-
-entry_formula = Entry(root)
-entry_formula.grid(row=1, column=4, padx=5, pady=10)
-
-# Create a button to save the formula and parameters into a file
-save_model_button = Button(root, text="Save Model", command=save_model)
-save_model_button.grid(row=1, column=5, padx=5, pady=10)
-
-load_model_button = Button(root, text="Load Model", command=load_model)
-load_model_button.grid(row=1, column=6, padx=5, pady=10)
-
-
-# Create a button to fit the model
-fit_button = Button(root, text="Fit Model", command=fit_model)
-fit_button.grid(row=2, column=2, padx=5, pady=10)
-
-# Create a button to load the data from a csv file
-load_button = Button(root, text="Load Data", command=add_data_points_from_file)
-load_button.grid(row=1, column=2, padx=5, pady=10)
-
-# Create a button to save the data to a csv file
-save_button = Button(root, text="Save Data", command=save_data_points_to_file)
-save_button.grid(row=3, column=1, padx=5, pady=10)
-
-# Create a button to generate a report of the data
-report_button = Button(root, text="Generate Report", command=generate_report)
-report_button.grid(row=3, column=0, padx=5, pady=10)
-
-# Create a button to brute force the model
-brute_force_button = Button(root, text="Brute Force Params", command=bruteforce_params)
-brute_force_button.grid(row=3, column=2, padx=5, pady=10)
-
-# Create labels for R-squared, p-value, and predicted parameter values
-label_r_squared = Label(root, text="R-squared: ")
-label_r_squared.grid(row=4, column=0, padx=5, pady=10)
-
-label_p_value = Label(root, text="p-value: ")
-label_p_value.grid(row=4, column=1, padx=5, pady=10)
-
-label_adjusted_r_squared = Label(root, text="Adjusted R-squared: ")
-label_adjusted_r_squared.grid(row=4, column=2, padx=5, pady=10)
-
-label_std_err = Label(root, text="Standard Error: ")
-label_std_err.grid(row=4, column=3, padx=5, pady=10)
-
-label_params = Label(root, text="Predicted Parameter Values: ")
-label_params.grid(row=5, column=0, columnspan=3, padx=5, pady=10)
-
-
-# Start the GUI event loop
-root.mainloop()
\ No newline at end of file
+        entries_param_lower.pop().destroy()
+        entries_param_upper.pop().destroy()
+
+# Function to handle the messages of the worker thread, it runs every 50 ms on the GUI thread
+def poll_worker():
+    worker.poll(show_worker_status)
+    root.after(50, poll_worker)
+
+# Function to show what the worker thread is doing in the status label and the progress bar
+def show_worker_status(kind, job, value):
+    if kind == "started":
+        progress_bar.start(10)
+        status = "{}: running".format(job.name)
+    elif kind == "progress":
+        status = "{}: {} evaluations, {} iterations".format(job.name, value["nfev"], value["njev"])
+        if "grid" in value:
+            status = "{}: {} of {} grid points".format(job.name, value["done"], value["grid"])
+        elif "models" in value:
+            status = "{}: {} of {} models fitted".format(job.name, value["fitted"], value["models"])
+        elif "resamples" in value:
+            status = "{}: {} of {} resamples refitted".format(job.name, value["fitted"], value["resamples"])
+        elif "fitted" in value:
+            status = "{}: {} starts fitted, best SSE {:.6g}".format(job.name, value["fitted"], value["best_sse"])
+    elif kind == "cancelled":
+        status = "{}: cancelled".format(job.name)
+    elif kind == "error":
+        status = "{}: failed".format(job.name)
+    else:
+        status = "{}: done".format(job.name)
+
+    if worker.idle():
+        progress_bar.stop()
+    elif worker.pending:
+        status += " ({} queued)".format(len(worker.pending))
+    label_status.config(text=status)
+
+# The GUI is only built when main.py is run, not when the worker processes of the
+# brute force search import it
+if __name__ == "__main__":
+    # Needed for the worker processes of the standalone executable
+    freeze_support()
+
+    # Create a GUI window
+    root = Tk()
+    root.title("Nonlinear Model Fitting")
+    root.resizable(False, False)
+
+    # Create a frame for the data points
+    frame = Frame(root)
+    frame.grid(row=0, columnspan=3)
+
+    # Keep the place of the plot of the data and the fitted curve, it is created once matplotlib is
+    # imported and reused for every fit
+    fit_plot = None
+    last_fit = None
+    plot_placeholder = Frame(root, width=500, height=350)
+    plot_placeholder.grid(row=0, column=3, columnspan=6, padx=5, pady=5)
+
+    # Create a label and entry box for the the x-axis label and the y-axis label of the graph
+    label_x = Label(frame, text="X-Axis Label")
+    label_x.grid(row=1, column=1, padx=5, pady=5)
+    x_axis_label = Entry(frame)
+    x_axis_label.grid(row=2, column=1, padx=5, pady=5)
+
+    label_y = Label(frame, text="Y-Axis Label")
+    label_y.grid(row=1, column=2, padx=5, pady=5)
+    y_axis_label = Entry(frame)
+    y_axis_label.grid(row=2, column=2, padx=5, pady=5)
+
+    # Create a label for the x and y data points
+    label_data_points = Label(frame, text="X Data")
+    label_data_points.grid(row=3, column=1, padx=5, pady=5)
+    label_data_points = Label(frame, text="Y Data")
+    label_data_points.grid(row=3, column=2, padx=5, pady=5)
+
+
+    # The data points, starting with two empty rows
+    data = DataStore(2)
+    first_visible_row = 0
+
+    # Create labels and entry boxes for the rows of the grid, only the visible rows get entry boxes
+    grid_rows = []
+    for i in range(VISIBLE_ROWS):
+        label_row = Label(frame, text=str(i + 1))
+        label_row.grid(row=i + 4, column=0, padx=5, pady=5, sticky="E")
+
+        entry_x = Entry(frame)
+        entry_y = Entry(frame)
+
+        entry_x.grid(row=i + 4, column=1, padx=5, pady=5)
+        entry_y.grid(row=i + 4, column=2, padx=5, pady=5)
+
+        # Store the values when the user leaves the box or presses enter, and scroll with the mouse wheel
+        for entry in (entry_x, entry_y):
+            entry.bind("<FocusOut>", commit_data_grid)
+            entry.bind("<Return>", commit_data_grid)
+            entry.bind("<MouseWheel>", scroll_data_wheel)
+            entry.bind("<Button-4>", scroll_data_wheel)
+            entry.bind("<Button-5>", scroll_data_wheel)
+            entry.bind("<KeyRelease>", schedule_live_fit)
+
+        grid_rows.append((label_row, entry_x, entry_y))
+
+    # Create a scrollbar for the data points
+    data_scrollbar = Scrollbar(frame, orient="vertical", command=scroll_data)
+    data_scrollbar.grid(row=4, column=3, rowspan=VISIBLE_ROWS, padx=5, pady=5, sticky="NS")
+    refresh_data_grid()
+
+    # Create buttons for adding and removing data points
+    add_button = Button(root, text="Add Data Point", command=add_data_point)
+    add_button.grid(row=1, column=0, padx=5, pady=10)
+
+    remove_button = Button(root, text="Remove Last Point", command=remove_data_point)
+    remove_button.grid(row=1, column=1, padx=5, pady=10)
+
+    add_button_param = Button(root, text="Add Params", command=add_param_point)
+    add_button_param.grid(row=2, column=0, padx=5, pady=10)
+
+    remove_button_param = Button(root, text="Remove Param", command=remove_param_point)
+    remove_button_param.grid(row=2, column=1, padx=5, pady=10)
+
+    # Create labels and entry boxes for the parameters
+    labels_param_name = []
+    entries_param_name = []
+    labels_param_value = []
+    entries_param_value = []
+    entries_param_lower = []
+    entries_param_upper = []
+    params = []
+    for i in range(2):
+        add_param_point()
+
+    # Create labels for the lower and upper bounds of the parameters
+    label_param_lower = Label(root, text="Lower Bound")
+    label_param_lower.grid(row=1, column=7, padx=5, pady=10)
+    label_param_upper = Label(root, text="Upper Bound")
+    label_param_upper.grid(row=1, column=8, padx=5, pady=10)
+
+    # Create a label and entry box for the formula
+    label_formula = Label(root, text="Formula: ")
+    label_formula.grid(row=1, column=3, padx=5, pady=10, sticky="E")
+
+    entry_formula = Entry(root)
+    entry_formula.grid(row=1, column=4, padx=5, pady=10)
+    entry_formula.bind("<KeyRelease>", schedule_live_fit)
+
+    # Create a button to save the formula and parameters into a file
+    save_model_button = Button(root, text="Save Model", command=save_model)
+    save_model_button.grid(row=1, column=5, padx=5, pady=10)
+
+    load_model_button = Button(root, text="Load Model", command=load_model)
+    load_model_button.grid(row=1, column=6, padx=5, pady=10)
+
+
+    # Create a button to fit the model
+    fit_button = Button(root, text="Fit Model", command=fit_model)
+    fit_button.grid(row=2, column=2, padx=5, pady=10)
+
+    # Create a button to load the data from a csv file
+    load_button = Button(root, text="Load Data", command=add_data_points_from_file)
+    load_button.grid(row=1, column=2, padx=5, pady=10)
+
+    # Create a button to save the data to a csv file
+    save_button = Button(root, text="Save Data", command=save_data_points_to_file)
+    save_button.grid(row=3, column=1, padx=5, pady=10)
+
+    # Create a button to generate a report of the data
+    report_button = Button(root, text="Generate Report", command=generate_report)
+    report_button.grid(row=3, column=0, padx=5, pady=10)
+
+    # Create a button to brute force the model
+    brute_force_button = Button(root, text="Brute Force Params", command=bruteforce_params)
+    brute_force_button.grid(row=3, column=2, padx=5, pady=10)
+
+    # Create a button to fit every model in the models folder and rank them
+    compare_button = Button(root, text="Compare Models", command=compare_models_window)
+    compare_button.grid(row=6, column=0, padx=5, pady=10)
+
+    # Create a cancel button, a progress bar and a status label for the jobs on the worker thread
+    # Clicking fit or brute force while a job is running queues the new job behind it
+    cancel_button = Button(root, text="Cancel", command=lambda: worker.cancel())
+    cancel_button.grid(row=6, column=1, padx=5, pady=10)
+
+    progress_bar = ttk.Progressbar(root, mode="indeterminate", length=150)
+    progress_bar.grid(row=6, column=2, padx=5, pady=10)
+
+    # Create a check box for live mode, it refits in the background while the data and parameters are edited
+    live_fit_enabled = BooleanVar(root, value=False)
+    live_fit_timer = None
+    live_fit_job = None
+    live_cache = LiveFitCache()
+    live_fit_button = Checkbutton(root, text="Live Fit", variable=live_fit_enabled, command=schedule_live_fit)
+    live_fit_button.grid(row=5, column=5, padx=5, pady=10)
+
+    # Create a check box for large data mode, data sets with more than LARGE_DATA_POINTS points are then
+    # fitted on a subsample first and then on all the points, starting from the fit of the subsample
+    large_data_enabled = BooleanVar(root, value=True)
+    large_data_button = Checkbutton(root, text="Large Data Mode", variable=large_data_enabled)
+    large_data_button.grid(row=5, column=6, padx=5, pady=10)
+
+    # Create a button to show where the time of the last fits went
+    diagnostics = Diagnostics()
+    diagnostics_button = Button(root, text="Diagnostics", command=diagnostics_window)
+    diagnostics_button.grid(row=6, column=7, padx=5, pady=10)
+
+    # Create a button to fit the formula to several data files with shared parameters
+    global_fit_button = Button(root, text="Global Fit", command=global_fit_window)
+    global_fit_button.grid(row=6, column=8, padx=5, pady=10)
+
+    # Create a button to show the sum of squared errors around the fit for two parameters
+    sse_map_button = Button(root, text="SSE Map", command=sse_map_window)
+    sse_map_button.grid(row=6, column=9, padx=5, pady=10)
+
+    label_status = Label(root, text="Ready")
+    label_status.grid(row=6, column=3, columnspan=4, padx=5, pady=10, sticky="W")
+
+    # Create a label and entry box for the number of starting points of the brute force search
+    label_starts = Label(root, text="Brute Force Starts: ")
+    label_starts.grid(row=5, column=3, padx=5, pady=10, sticky="E")
+    entry_starts = Entry(root)
+    entry_starts.grid(row=5, column=4, padx=5, pady=10)
+    entry_starts.insert(0, "32")
+
+    # Create labels for R-squared, p-value, and predicted parameter values
+    label_r_squared = Label(root, text="R-squared: ")
+    label_r_squared.grid(row=4, column=0, padx=5, pady=10)
+
+    label_p_value = Label(root, text="p-value: ")
+    label_p_value.grid(row=4, column=1, padx=5, pady=10)
+
+    label_adjusted_r_squared = Label(root, text="Adjusted R-squared: ")
+    label_adjusted_r_squared.grid(row=4, column=2, padx=5, pady=10)
+
+    label_std_err = Label(root, text="Standard Error: ")
+    label_std_err.grid(row=4, column=3, padx=5, pady=10)
+
+    label_params = Label(root, text="Predicted Parameter Values: ")
+    label_params.grid(row=5, column=0, columnspan=3, padx=5, pady=10)
+
+    # Create a button and a label for the bootstrap confidence intervals of the parameters
+    bootstrap_button = Button(root, text="Bootstrap CI", command=bootstrap_params)
+    bootstrap_button.grid(row=7, column=0, padx=5, pady=10)
+    label_ci = Label(root, text="Confidence Intervals: ")
+    label_ci.grid(row=7, column=1, columnspan=6, padx=5, pady=10, sticky="W")
+
+    # Create buttons to save and open the data, the model and the fits as one project file
+    # The fits are cached under a hash of the data, formula, starting parameters and bounds
+    fit_cache = FitCache()
+    last_fit_key = None
+    save_project_button = Button(root, text="Save Project", command=save_project_file)
+    save_project_button.grid(row=7, column=7, padx=5, pady=10)
+    open_project_button = Button(root, text="Open Project", command=open_project_file)
+    open_project_button.grid(row=7, column=8, padx=5, pady=10)
+
+
+    # Start the worker thread that runs the fits, and check on it from the GUI event loop
+    worker = FitWorker()
+    poll_worker()
+
+    # Import scipy and matplotlib in the background, and show the plot when they are ready
+    preload_thread = threading.Thread(target=preload_modules, daemon=True)
+    preload_thread.start()
+    show_plot_when_ready()
+
+    # Start the GUI event loop
+    root.mainloop()
@@ -1,4 +1,27 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
+
+# The default build is a folder with main.exe in it, it starts fast because nothing has to be unpacked.
+# Set ONEFILE=1 to build a single main.exe instead, it unpacks itself to a temporary folder on every start.
+ONEFILE = os.environ.get("ONEFILE") == "1"
+
+# Modules that are installed with the libraries but never used, leaving them out makes the build
+# smaller and quicker to unpack and start. Only tkinter is used for the GUI, and matplotlib only needs
+# its Tk and Agg backends.
+EXCLUDES = [
+    "IPython", "jupyter", "notebook", "ipykernel", "pytest", "sphinx", "docutils",
+    "PyQt5", "PyQt6", "PySide2", "PySide6", "wx", "gi", "tornado",
+    "matplotlib.backends.backend_qt", "matplotlib.backends.backend_qtagg", "matplotlib.backends.backend_qtcairo",
+    "matplotlib.backends.backend_gtk3", "matplotlib.backends.backend_gtk3agg", "matplotlib.backends.backend_gtk4",
+    "matplotlib.backends.backend_wx", "matplotlib.backends.backend_wxagg", "matplotlib.backends.backend_webagg",
+    "matplotlib.backends.backend_nbagg", "matplotlib.backends.backend_macosx",
+    "pandas", "sympy", "numba", "dask", "xarray", "h5py", "tables",
+    "scipy.io", "scipy.signal", "scipy.datasets", "scipy.odr", "scipy.fft._pocketfft.tests",
+    "numpy.distutils", "lib2to3", "pydoc_data", "tkinter.test", "test",
+]
+
+# The modules main.py imports on a background thread by name, PyInstaller can not see those imports
+HIDDEN_IMPORTS = ["engine", "functions", "plotting", "report", "compare", "global_fit", "bootstrap", "landscape"]
 
 
 block_cipher = None
@@ -9,11 +32,11 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=HIDDEN_IMPORTS,
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=EXCLUDES,
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -21,24 +44,54 @@ a = Analysis(
 )
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
-    [],
-    name='main',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=True,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+# UPX makes the files smaller but every library has to be decompressed again on every start
+if ONEFILE:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        [],
+        name='main',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='main',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='main',
+    )
@@ -0,0 +1,355 @@
+import ast
+import math
+import operator
+from functools import lru_cache
+import numpy as np
+
+# Turns the formula typed by the user into a vectorized python function
+# The formula is parsed once into a syntax tree, checked so that only numbers, x, the parameters
+# and the functions below can be used, and then compiled. Compiled models are cached, so fitting
+# the same formula again, brute forcing it or fitting it to a whole batch of files only compiles it once.
+
+# Functions that can be used in a formula, they are all numpy ufuncs so they work on whole arrays
+FUNCTIONS = {
+    "exp": np.exp,
+    "log": np.log,
+    "ln": np.log,
+    "log10": np.log10,
+    "log2": np.log2,
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "arcsin": np.arcsin,
+    "arccos": np.arccos,
+    "arctan": np.arctan,
+    "sinh": np.sinh,
+    "cosh": np.cosh,
+    "tanh": np.tanh,
+}
+
+# Constants that can be used in a formula
+CONSTANTS = {
+    "pi": np.pi,
+    "e": np.e,
+}
+
+
+# The log in the derivative of u**v with respect to the exponent, d(u**v)/dv = u**v * log(u)
+# At u = 0 that is 0 * -inf, but u**v goes to 0 faster than log(u) goes to -inf, so the derivative is 0.
+# Without this a single x = 0 point, as in Kf*x**(1/n), makes a whole column of the jacobian nan.
+def power_log(u):
+    return np.log(np.where(u == 0, 1.0, u))
+
+
+# Functions the derivatives use that can not be typed in a formula, their names start with an underscore
+DERIVATIVE_FUNCTIONS = {
+    "_power_log": power_log,
+}
+
+# The only parts of python syntax that are allowed in a formula
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd,
+)
+
+# The largest exponent of a power of two numbers in a formula, python computes powers of whole numbers
+# exactly, so "9**9**9" would keep the process busy for hours
+MAX_CONSTANT_EXPONENT = 100
+
+# The size of the cache of compiled models, the least recently used model is dropped when it is full
+CACHE_SIZE = 128
+
+
+# Rewrites the parts of the formula that are written differently in python
+class FormulaRewriter(ast.NodeTransformer):
+    # "np.exp(x)" and "numpy.exp(x)" are the same as "exp(x)"
+    def visit_Attribute(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id in ("np", "numpy"):
+            if node.attr in FUNCTIONS or node.attr in CONSTANTS:
+                return ast.copy_location(ast.Name(id=node.attr, ctx=ast.Load()), node)
+        return node
+
+
+# Function to parse and check a formula, it returns the syntax tree of the formula
+# A ValueError is raised if the formula can not be used, so it fails before the fitting starts
+def parse_formula(formula, param_names):
+    param_names = tuple(param_names)
+    for name in param_names:
+        if not name.isidentifier():
+            raise ValueError("Invalid parameter name '{}'".format(name))
+        if name == "x" or name in FUNCTIONS or name in CONSTANTS:
+            raise ValueError("Parameter name '{}' is reserved".format(name))
+    if len(set(param_names)) != len(param_names):
+        raise ValueError("Parameter names must be unique")
+
+    # "^" means power in a formula, but it is xor in python
+    formula = formula.strip().replace("^", "**")
+    try:
+        tree = ast.parse(formula, mode="eval")
+    except SyntaxError as e:
+        raise ValueError("Invalid formula: {}".format(e.msg))
+    tree = ast.fix_missing_locations(FormulaRewriter().visit(tree))
+
+    # A function name is only allowed as the function of a call, "a*exp + x" is an error
+    names = set(param_names) | {"x"} | set(CONSTANTS)
+    called = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ValueError("'{}' is not allowed in a formula".format(ast.unparse(node)))
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                raise ValueError("Unknown function '{}' in formula".format(ast.unparse(node.func)))
+            if len(node.args) != 1 or node.keywords:
+                raise ValueError("Function '{}' takes exactly one argument".format(node.func.id))
+        elif isinstance(node, ast.Name) and node.id in FUNCTIONS and id(node) not in called:
+            raise ValueError("Function '{}' has to be called, for example {}(x)".format(node.id, node.id))
+        elif isinstance(node, ast.Name) and node.id not in names and node.id not in FUNCTIONS:
+            raise ValueError("Unknown name '{}' in formula".format(node.id))
+        elif isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError("Only numbers can be used as constants in a formula")
+    constant_value(tree.body)
+    return tree
+
+
+# Function to get the value of a part of a formula that is made of numbers only, or None if it is not
+# A ValueError is raised for a power of numbers with a too large exponent or a too large result
+def constant_value(node):
+    if isinstance(node, ast.Constant):
+        try:
+            return float(node.value)
+        except OverflowError:
+            raise ValueError("A number in the formula is too large")
+    if isinstance(node, ast.UnaryOp):
+        operand = constant_value(node.operand)
+        return None if operand is None else -operand if isinstance(node.op, ast.USub) else operand
+    if isinstance(node, ast.Call):
+        constant_value(node.args[0])
+        return None
+    if not isinstance(node, ast.BinOp):
+        return None
+    left = constant_value(node.left)
+    right = constant_value(node.right)
+    if left is None or right is None:
+        return None
+    if isinstance(node.op, ast.Pow) and abs(right) > MAX_CONSTANT_EXPONENT:
+        raise ValueError("The exponent of '{}' is too large".format(ast.unparse(node)))
+    try:
+        value = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+                 ast.Div: operator.truediv, ast.Pow: operator.pow}[type(node.op)](left, right)
+    except OverflowError:
+        raise ValueError("'{}' is too large".format(ast.unparse(node)))
+    except ZeroDivisionError:
+        return None
+    if isinstance(value, complex):
+        return None
+    if not math.isfinite(value):
+        raise ValueError("'{}' is too large".format(ast.unparse(node)))
+    return value
+
+
+# Function to compile a syntax tree into a function of x and the parameters
+def compile_tree(tree, param_names, broadcast=True):
+    body = tree.body
+    # Make sure the result always has the shape of x, even if the formula does not use x
+    if broadcast and not depends_on(body, "x"):
+        zero = ast.BinOp(left=ast.Constant(value=0.0), op=ast.Mult(), right=ast.Name(id="x", ctx=ast.Load()))
+        body = ast.BinOp(left=body, op=ast.Add(), right=zero)
+
+    arguments = ast.arguments(
+        posonlyargs=[],
+        args=[ast.arg(arg=name) for name in ("x",) + tuple(param_names)],
+        kwonlyargs=[],
+        kw_defaults=[],
+        defaults=[],
+    )
+    expression = ast.fix_missing_locations(ast.Expression(body=ast.Lambda(args=arguments, body=body)))
+    namespace = {"__builtins__": {}}
+    namespace.update(FUNCTIONS)
+    namespace.update(CONSTANTS)
+    namespace.update(DERIVATIVE_FUNCTIONS)
+    return eval(compile(expression, "<formula>", "eval"), namespace)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile_model(formula, param_names):
+    return compile_tree(parse_formula(formula, param_names), param_names)
+
+
+# Function to get the compiled model for a formula and its parameter names
+# The result is cached, so the same formula is only parsed and compiled once
+def compile_model(formula, param_names):
+    return _compile_model(formula, tuple(param_names))
+
+
+# Function to clear the cache of compiled models
+def clear_model_cache():
+    _compile_model.cache_clear()
+    _compile_jacobian.cache_clear()
+
+
+# Function to get the hits, misses and size of the cache of compiled models
+def model_cache_info():
+    return _compile_model.cache_info()
+
+
+# The analytic jacobian of a formula, the formula is differentiated symbolically with respect to
+# every parameter and the derivatives are compiled just like the model. Passing it to curve_fit as
+# jac saves the k+1 model evaluations of the finite difference estimate on every iteration.
+
+# Small helpers that build syntax tree nodes and simplify the obvious cases, so the derivatives
+# do not fill up with multiplications by zero and one
+def number(value):
+    return ast.Constant(value=value)
+
+
+def is_number(node, value=None):
+    if not isinstance(node, ast.Constant):
+        return False
+    return value is None or node.value == value
+
+
+def add(left, right):
+    if is_number(left, 0):
+        return right
+    if is_number(right, 0):
+        return left
+    if is_number(left) and is_number(right):
+        return number(left.value + right.value)
+    return ast.BinOp(left=left, op=ast.Add(), right=right)
+
+
+def sub(left, right):
+    if is_number(right, 0):
+        return left
+    if is_number(left, 0):
+        return neg(right)
+    if is_number(left) and is_number(right):
+        return number(left.value - right.value)
+    return ast.BinOp(left=left, op=ast.Sub(), right=right)
+
+
+def mul(left, right):
+    if is_number(left, 0) or is_number(right, 0):
+        return number(0)
+    if is_number(left, 1):
+        return right
+    if is_number(right, 1):
+        return left
+    if is_number(left) and is_number(right):
+        return number(left.value * right.value)
+    return ast.BinOp(left=left, op=ast.Mult(), right=right)
+
+
+def div(left, right):
+    if is_number(left, 0):
+        return number(0)
+    if is_number(right, 1):
+        return left
+    return ast.BinOp(left=left, op=ast.Div(), right=right)
+
+
+def power(left, right):
+    if is_number(right, 1):
+        return left
+    if is_number(right, 0):
+        return number(1)
+    return ast.BinOp(left=left, op=ast.Pow(), right=right)
+
+
+def neg(node):
+    if is_number(node):
+        return number(-node.value)
+    return ast.UnaryOp(op=ast.USub(), operand=node)
+
+
+def call(name, node):
+    return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=[node], keywords=[])
+
+
+# Function to check if a syntax tree uses a name
+def depends_on(node, name):
+    return any(isinstance(child, ast.Name) and child.id == name for child in ast.walk(node))
+
+
+# The derivative of every function that can be used in a formula, given its argument u
+FUNCTION_DERIVATIVES = {
+    "exp": lambda u: call("exp", u),
+    "log": lambda u: div(number(1), u),
+    "ln": lambda u: div(number(1), u),
+    "log10": lambda u: div(number(1), mul(u, number(float(np.log(10))))),
+    "log2": lambda u: div(number(1), mul(u, number(float(np.log(2))))),
+    "sqrt": lambda u: div(number(1), mul(number(2), call("sqrt", u))),
+    "abs": lambda u: div(u, call("abs", u)),
+    "sin": lambda u: call("cos", u),
+    "cos": lambda u: neg(call("sin", u)),
+    "tan": lambda u: div(number(1), power(call("cos", u), number(2))),
+    "arcsin": lambda u: div(number(1), call("sqrt", sub(number(1), power(u, number(2))))),
+    "arccos": lambda u: neg(div(number(1), call("sqrt", sub(number(1), power(u, number(2)))))),
+    "arctan": lambda u: div(number(1), add(number(1), power(u, number(2)))),
+    "sinh": lambda u: call("cosh", u),
+    "cosh": lambda u: call("sinh", u),
+    "tanh": lambda u: sub(number(1), power(call("tanh", u), number(2))),
+}
+
+
+# Function to differentiate a syntax tree with respect to a name, it returns a new syntax tree
+def differentiate(node, name):
+    if not depends_on(node, name):
+        return number(0)
+    if isinstance(node, ast.Name):
+        return number(1)
+    if isinstance(node, ast.UnaryOp):
+        derivative = differentiate(node.operand, name)
+        return neg(derivative) if isinstance(node.op, ast.USub) else derivative
+    if isinstance(node, ast.Call):
+        # Chain rule, f(u)' = f'(u) * u'
+        u = node.args[0]
+        return mul(FUNCTION_DERIVATIVES[node.func.id](u), differentiate(u, name))
+
+    left, right = node.left, node.right
+    d_left, d_right = differentiate(left, name), differentiate(right, name)
+    if isinstance(node.op, ast.Add):
+        return add(d_left, d_right)
+    if isinstance(node.op, ast.Sub):
+        return sub(d_left, d_right)
+    if isinstance(node.op, ast.Mult):
+        return add(mul(d_left, right), mul(left, d_right))
+    if isinstance(node.op, ast.Div):
+        return sub(div(d_left, right), div(mul(left, d_right), power(right, number(2))))
+    # Power, with the simpler rules when only the base or only the exponent depends on the name
+    if not depends_on(right, name):
+        return mul(mul(right, power(left, sub(right, number(1)))), d_left)
+    if not depends_on(left, name):
+        return mul(mul(node, call("_power_log", left)), d_right)
+    return mul(node, add(mul(d_right, call("_power_log", left)), div(mul(right, d_left), left)))
+
+
+# Function to get the derivatives of a formula with respect to each parameter as formulas
+def derivative_formulas(formula, param_names):
+    tree = parse_formula(formula, param_names)
+    return [ast.unparse(ast.fix_missing_locations(differentiate(tree.body, name))) for name in param_names]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile_jacobian(formula, param_names):
+    tree = parse_formula(formula, param_names)
+    columns = [differentiate(tree.body, name) for name in param_names]
+    derivatives = compile_tree(ast.Expression(body=ast.Tuple(elts=columns, ctx=ast.Load())), param_names, broadcast=False)
+
+    # curve_fit wants a 2-D array with one row per x value and one column per parameter
+    # Derivatives that do not depend on x are single numbers, assigning them fills the whole column
+    def jacobian(x, *params):
+        x = np.asarray(x, dtype=float)
+        out = np.empty(x.shape + (len(columns),))
+        for index, column in enumerate(derivatives(x, *params)):
+            out[..., index] = column
+        return out
+
+    return jacobian
+
+
+# Function to get the compiled jacobian of a formula, it is cached just like the compiled model
+def compile_jacobian(formula, param_names):
+    return _compile_jacobian(formula, tuple(param_names))
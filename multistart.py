@@ -0,0 +1,229 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import curve_fit
+from model_compiler import compile_model, compile_jacobian
+
+# Multi-start global search, curve_fit is started from many points spread over the parameter bounds
+# and the distinct solutions are returned, best first. The local fits can be given hard bounds of their
+# own, the bounds the user entered, so no solution is outside them. They run in a pool of worker processes,
+# every worker compiles the formula once and keeps the data, so only the starting points are sent to it.
+
+# The ways to spread the starting points over the bounds
+METHODS = ("log-uniform", "sobol", "lhs")
+
+
+# Function to get default bounds around the initial parameters, three decades on either side
+# The sign of every parameter is kept, a parameter that starts at zero is searched between -1 and 1
+def default_bounds(initial_parameters):
+    lower, upper = [], []
+    for value in initial_parameters:
+        if value > 0:
+            lower.append(value * 1e-3)
+            upper.append(value * 1e3)
+        elif value < 0:
+            lower.append(value * 1e3)
+            upper.append(value * 1e-3)
+        else:
+            lower.append(-1.0)
+            upper.append(1.0)
+    return np.array(lower, dtype=float), np.array(upper, dtype=float)
+
+
+# Function to map points in the unit cube onto the bounds
+# Bounds that do not cross zero are mapped on a log scale, so every decade gets the same share of points
+def scale_points(unit, lower, upper):
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    logarithmic = (lower * upper > 0)
+    linear = lower + unit * (upper - lower)
+
+    sign = np.where(lower < 0, -1.0, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_lower = np.log(np.where(logarithmic, np.abs(lower), 1.0))
+        log_upper = np.log(np.where(logarithmic, np.abs(upper), 1.0))
+    logs = sign * np.exp(log_lower + unit * (log_upper - log_lower))
+    return np.where(logarithmic, logs, linear)
+
+
+# Function to draw n starting points from the bounds with one of the METHODS
+# scipy.stats takes half a second to import, so qmc is only imported by the methods that need it
+def sample_starts(lower, upper, n, method="sobol", seed=None):
+    k = len(lower)
+    if method in ("sobol", "lhs"):
+        from scipy.stats import qmc
+    if method == "log-uniform":
+        unit = np.random.default_rng(seed).random((n, k))
+    elif method == "sobol":
+        # Sobol points are balanced in blocks of a power of two, so draw the next power of two and keep n
+        m = max(0, int(np.ceil(np.log2(max(n, 1)))))
+        unit = qmc.Sobol(d=k, seed=seed).random_base2(m)[:n]
+    elif method == "lhs":
+        unit = qmc.LatinHypercube(d=k, seed=seed).random(n)
+    else:
+        raise ValueError("Unknown sampling method '{}', use one of {}".format(method, ", ".join(METHODS)))
+    return scale_points(unit, lower, upper)
+
+
+# The largest number of model values computed at once when screening, about 32 MB of float64
+SCREEN_CHUNK = 4_000_000
+
+
+# Function to compute the sum of squared errors of the model for many parameter vectors at once
+# The parameters are passed as columns, so the model broadcasts to a candidates x points array and a
+# whole chunk of candidates is evaluated in one numpy call. Candidates whose model values are not
+# finite get an infinite loss.
+def screen_losses(model, x, y, candidates, chunk_size=SCREEN_CHUNK):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    candidates = np.atleast_2d(np.asarray(candidates, dtype=float))
+    losses = np.empty(len(candidates))
+
+    rows = max(1, chunk_size // max(1, len(x)))
+    with np.errstate(all="ignore"):
+        for start in range(0, len(candidates), rows):
+            block = candidates[start:start + rows]
+            y_model = model(x[np.newaxis, :], *(block[:, [i]] for i in range(block.shape[1])))
+            losses[start:start + len(block)] = np.sum((y_model - y) ** 2, axis=1)
+    losses[~np.isfinite(losses)] = np.inf
+    return losses
+
+
+# Function to pick the keep candidates with the lowest loss, best first
+# It returns their indices and the losses of all the candidates
+def prescreen(formula, param_names, x, y, candidates, keep):
+    losses = screen_losses(compile_model(formula, param_names), x, y, candidates)
+    keep = min(keep, len(losses))
+    best = np.argpartition(losses, keep - 1)[:keep]
+    best = best[np.argsort(losses[best])]
+    # Candidates with an infinite loss are hopeless, they are not worth a local fit
+    return best[np.isfinite(losses[best])], losses
+
+
+# The state of a worker process, set once when the worker starts
+_worker = {}
+
+
+def _init_worker(formula, param_names, x, y, bounds):
+    _worker["model"] = compile_model(formula, param_names)
+    _worker["jac"] = compile_jacobian(formula, param_names)
+    _worker["x"] = x
+    _worker["y"] = y
+    _worker["bounds"] = bounds
+
+
+# Function to run curve_fit from each of the starting points, it runs inside a worker process
+# With bounds curve_fit uses the trf method and keeps the parameters inside them, a starting point
+# outside the bounds is moved onto them first
+# Starting points that fail to converge are left out, they do not stop the rest
+# It returns the solutions and the number of model evaluations of the successful fits
+def _fit_starts(starts):
+    model, jac, x, y, bounds = _worker["model"], _worker["jac"], _worker["x"], _worker["y"], _worker["bounds"]
+    solutions = []
+    nfev = 0
+    for start in starts:
+        try:
+            with np.errstate(all="ignore"):
+                popt, _, infodict, _, _ = curve_fit(model, x, y, p0=np.clip(start, *bounds), jac=jac, bounds=bounds,
+                                                    full_output=True)
+                sse = float(np.sum((y - model(x, *popt)) ** 2))
+        except Exception:
+            continue
+        nfev += int(infodict.get("nfev", 0))
+        if np.isfinite(sse) and np.all(np.isfinite(popt)):
+            solutions.append((sse, popt))
+    return solutions, nfev
+
+
+# Function to add a solution to the list of distinct optima, kept sorted by the sum of squared errors
+# Solutions that converged to the same point as one already in the list are merged, keeping the better one
+def add_solution(optima, sse, popt, rtol=1e-4):
+    for index, (other_sse, other_popt) in enumerate(optima):
+        if np.allclose(popt, other_popt, rtol=rtol, atol=rtol * 1e-3):
+            if sse < other_sse:
+                optima[index] = (sse, popt)
+                optima.sort(key=lambda optimum: optimum[0])
+            return
+    optima.append((sse, popt))
+    optima.sort(key=lambda optimum: optimum[0])
+
+
+# Function to search for the best fits of a formula from many starting points
+# If screen is set, that many candidates are drawn and only the starts with the lowest loss are fitted
+# The starts are fitted in rounds, and the search stops early once the best sum of squared errors has
+# not improved by more than tol for patience rounds in a row. It returns up to top distinct optima,
+# each as a dictionary with the parameters and the sum of squared errors, best first.
+# If a diagnostics dictionary is passed, the screened candidates and their losses are stored in it, with
+# the time the screening took, the number of rounds, starts fitted and model evaluations of the search.
+# callback is called after every round with the round, the number of starts fitted and the best sum of
+# squared errors, it can raise an exception to stop the search.
+# lower and upper only spread the starting points, bounds are the hard bounds of the local fits as
+# (lower, upper), with inf where a parameter has no bound. Without bounds the local fits are not bounded.
+def multistart_fit(formula, param_names, x, y, lower, upper, starts=256, method="sobol", top=5,
+                   workers=None, initial_parameters=None, seed=None, patience=3, tol=1e-9,
+                   screen=None, diagnostics=None, callback=None, bounds=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Check the formula and the bounds here, so a mistake is reported before any process is started
+    compile_model(formula, param_names)
+    if bounds is not None:
+        bounds = (np.asarray(bounds[0], dtype=float), np.asarray(bounds[1], dtype=float))
+        if np.any(bounds[0] >= bounds[1]):
+            raise ValueError("Every lower bound must be less than its upper bound")
+    else:
+        bounds = (-np.inf, np.inf)
+
+    if screen and screen > starts:
+        screen_start = time.perf_counter()
+        candidates = sample_starts(lower, upper, screen, method, seed)
+        best, losses = prescreen(formula, param_names, x, y, candidates, starts)
+        points = candidates[best]
+        if diagnostics is not None:
+            diagnostics["candidates"] = candidates
+            diagnostics["losses"] = losses
+            diagnostics["screen_time"] = time.perf_counter() - screen_start
+    else:
+        points = sample_starts(lower, upper, starts, method, seed)
+    if initial_parameters is not None:
+        points = np.vstack([np.asarray(initial_parameters, dtype=float), points])
+
+    if len(points) == 0:
+        return []
+
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, min(16, len(points) // (workers * 4)))
+    batches = [points[i:i + chunk] for i in range(0, len(points), chunk)]
+
+    optima = []
+    best_sse = np.inf
+    rounds_without_improvement = 0
+    nfev = 0
+    fitted = 0
+    rounds = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(formula, tuple(param_names), x, y, bounds)) as executor:
+        # One round is one batch for every worker
+        for i in range(0, len(batches), workers):
+            for solutions, batch_nfev in executor.map(_fit_starts, batches[i:i + workers]):
+                nfev += batch_nfev
+                for sse, popt in solutions:
+                    add_solution(optima, sse, popt)
+            fitted = sum(len(batch) for batch in batches[:i + workers])
+            rounds = i // workers + 1
+            if diagnostics is not None:
+                diagnostics.update(nfev=nfev, starts_fitted=fitted, rounds=rounds)
+
+            if callback is not None:
+                callback(round=rounds, fitted=fitted, best_sse=optima[0][0] if optima else np.inf)
+
+            # The first optimum found always counts as an improvement, inf - inf would be nan
+            if optima and (not np.isfinite(best_sse) or optima[0][0] < best_sse - tol * max(1.0, abs(best_sse))):
+                best_sse = optima[0][0]
+                rounds_without_improvement = 0
+            else:
+                rounds_without_improvement += 1
+                if rounds_without_improvement >= patience:
+                    break
+
+    return [{"params": popt, "sse": sse} for sse, popt in optima[:top]]
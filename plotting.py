@@ -0,0 +1,151 @@
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+# The plot of the data and the fitted curve, embedded in the main window
+# There is one figure for the whole session. Every fit reuses the same line and scatter artists, and
+# when the new data fits inside the current axes only those two artists are redrawn on top of a saved
+# background (blitting) instead of drawing the whole figure again. Big data sets are decimated before
+# they are drawn, so the time to redraw does not grow with the number of points.
+
+# The largest number of data points that is drawn, bigger data sets are decimated
+MAX_PLOT_POINTS = 4000
+
+
+# Function to reduce the data to at most max_points points for drawing
+# The x range is split into max_points / 2 bins and the lowest and highest point of every bin are kept,
+# so spikes and outliers stay visible, which they would not with plain subsampling
+def decimate(x, y, max_points=MAX_PLOT_POINTS):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= max_points:
+        return x, y
+
+    bins_count = max(1, max_points // 2)
+    x_min, x_max = x.min(), x.max()
+    if x_max == x_min:
+        bins = np.zeros(len(x), dtype=np.int64)
+    else:
+        bins = np.minimum(((x - x_min) / (x_max - x_min) * bins_count).astype(np.int64), bins_count - 1)
+
+    # Sort by bin and then by y, the first and last point of every bin are its lowest and highest point
+    order = np.lexsort((y, bins))
+    sorted_bins = bins[order]
+    starts = np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+    keep = np.unique(np.r_[order[starts], order[ends]])
+    return x[keep], y[keep]
+
+
+# Function to get the x values to draw a fitted curve at, with more points where the curve bends
+# It starts from an even grid and keeps adding the midpoints of the intervals where the curve at the
+# midpoint is further than tolerance times the height of the curve from the straight line between the
+# ends, until no interval needs one or there are max_points points. It returns x and the curve at x.
+def adaptive_grid(function, x_min, x_max, points=65, max_points=2049, tolerance=1e-3):
+    x = np.linspace(float(x_min), float(x_max), points)
+    with np.errstate(all="ignore"):
+        y = np.asarray(function(x), dtype=float) * np.ones(len(x))
+        while len(x) < max_points:
+            finite = y[np.isfinite(y)]
+            height = finite.max() - finite.min() if len(finite) else 0.0
+            middle = (x[:-1] + x[1:]) / 2
+            y_middle = np.asarray(function(middle), dtype=float) * np.ones(len(middle))
+            error = np.abs(y_middle - (y[:-1] + y[1:]) / 2)
+            # Intervals where the curve is not finite are split too, to find where it goes off
+            split = ~(error <= tolerance * height) & (np.diff(x) > 0)
+            if not split.any():
+                break
+            # Split the worst intervals first if there is not room for all of them
+            room = max_points - len(x)
+            if split.sum() > room:
+                worst = np.argsort(-np.where(np.isfinite(error), error, np.inf))[:room]
+                split = np.zeros(len(split), dtype=bool)
+                split[worst] = True
+            index = np.flatnonzero(split) + 1
+            x = np.insert(x, index, middle[split])
+            y = np.insert(y, index, y_middle[split])
+    return x, y
+
+
+# Function to draw a map of the sum of squared errors, see landscape.sse_landscape, into a figure
+# The colours are the log of the sum of squared errors, so the valley around the fit stays visible
+# next to the much bigger errors at the edges of the map, and the fitted parameters are marked
+def draw_landscape(figure, landscape, levels=30):
+    ax = figure.add_subplot(111)
+    sse = np.asarray(landscape["sse"], dtype=float)
+    with np.errstate(all="ignore"):
+        log_sse = np.ma.masked_invalid(np.log10(np.maximum(sse, np.finfo(float).tiny)))
+    if log_sse.count() > 1 and log_sse.min() < log_sse.max():
+        contours = ax.contourf(landscape["first_values"], landscape["second_values"], log_sse, levels=levels, cmap="viridis")
+        figure.colorbar(contours, ax=ax, label="log10 SSE")
+    first, second = landscape["params"]
+    ax.plot([first], [second], "r+", markersize=12, markeredgewidth=2, label="Fitted Parameters")
+    ax.set_xlabel(landscape["param_names"][0])
+    ax.set_ylabel(landscape["param_names"][1])
+    ax.legend(loc="upper right")
+    figure.tight_layout()
+    return ax
+
+
+class FitPlot:
+    def __init__(self, master, figsize=(5, 3.5), dpi=100):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.ax = self.figure.add_subplot(111)
+        # The artists are animated, so they are left out of the background and drawn on top of it
+        self.line, = self.ax.plot([], [], 'r-', label='Fitted Curve', animated=True)
+        self.scatter, = self.ax.plot([], [], 'bo', label='Data Points', markersize=4, animated=True)
+        self.ax.legend()
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.widget = self.canvas.get_tk_widget()
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+
+    # Called after every full draw, it saves the background and draws the artists on top of it
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        self.ax.draw_artist(self.line)
+        self.ax.draw_artist(self.scatter)
+
+    # Function to show new data and a new fitted curve
+    def update(self, x, y, x_fit, y_fit, x_label="", y_label=""):
+        x_plot, y_plot = decimate(x, y)
+        self.scatter.set_data(x_plot, y_plot)
+        self.line.set_data(x_fit, y_fit)
+
+        # The whole figure has to be drawn again if the labels change or the data does not fit the axes
+        labels_changed = (self.ax.get_xlabel(), self.ax.get_ylabel()) != (x_label, y_label)
+        if labels_changed or self.background is None or not self.fits_view(x_plot, y_plot, x_fit, y_fit):
+            self.ax.set_xlabel(x_label)
+            self.ax.set_ylabel(y_label)
+            self.rescale(x_plot, y_plot, x_fit, y_fit)
+            self.canvas.draw()
+            return
+
+        # Otherwise only the line and the points are drawn again, on top of the saved background
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.figure.bbox)
+
+    # Function to check if all the points and the curve are inside the current axes
+    def fits_view(self, *arrays):
+        x_low, x_high = self.ax.get_xlim()
+        y_low, y_high = self.ax.get_ylim()
+        for values, low, high in zip(arrays, (x_low, y_low, x_low, y_low), (x_high, y_high, x_high, y_high)):
+            finite = values[np.isfinite(values)]
+            if len(finite) and (finite.min() < low or finite.max() > high):
+                return False
+        return True
+
+    # Function to set the axes limits to the data and the curve, with a small margin
+    def rescale(self, x_plot, y_plot, x_fit, y_fit):
+        for values, set_limits in ((np.r_[x_plot, x_fit], self.ax.set_xlim), (np.r_[y_plot, y_fit], self.ax.set_ylim)):
+            finite = values[np.isfinite(values)]
+            if len(finite) == 0:
+                continue
+            low, high = finite.min(), finite.max()
+            margin = (high - low) * 0.05 or abs(high) * 0.05 or 1.0
+            set_limits(low - margin, high + margin)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+
+# Project files, a whole session in one file: the data, the model and every fit result
+# A project is a numpy .npz file. The arrays (the data and the covariance matrices of the fits) are
+# stored as arrays, and everything else is in a json manifest stored in the same file, so it can be
+# opened without pickle. A project dictionary looks like:
+#   {"datasets": [{"name", "x", "y", "x_label", "y_label"}],
+#    "model": {"formula", "params": [[name, value, lower, upper], ...]},
+#    "fits": FitCache, "last_fit": key of the fit that was shown}
+# Every fit result is kept with the formula it was fitted with, next to its parameter names, so a fit
+# can be shown again even if the model of the project was changed after it.
+#
+# Fit results are cached under a hash of everything that decides the result, the data, the formula,
+# the starting parameters and the bounds, so fitting the same thing again is a lookup instead of a fit.
+# The cache is saved with the project, so the fits are still there when the project is opened again.
+
+PROJECT_VERSION = 1
+
+# The most fit results that are kept, the least recently used ones are dropped first
+MAX_FITS = 1000
+
+
+# Function to get the cache key of a fit, a hash of the data, the formula and the starting parameters
+# kind tells fits apart that are started from the same values, for example "fit" and "bruteforce",
+# and options are any other settings that change the result, for example the number of starts
+def fit_key(kind, x, y, formula, param_names, params, lower=None, upper=None, **options):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+    digest.update(b"|")
+    digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+
+    def values(array):
+        return None if array is None else [float(value) for value in array]
+
+    digest.update(repr((kind, formula, list(param_names), values(params), values(lower), values(upper),
+                        sorted(options.items()))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class FitCache:
+    def __init__(self, max_fits=MAX_FITS):
+        self.fits = OrderedDict()
+        self.max_fits = max_fits
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.fits)
+
+    def __contains__(self, key):
+        return key in self.fits
+
+    # Function to get a cached fit result, or None, a copy is returned so the cached one can not change
+    def get(self, key):
+        result = self.fits.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.fits.move_to_end(key)
+        return dict(result)
+
+    # formula is the formula the result was fitted with, it is kept in the result
+    def put(self, key, result, formula=None):
+        self.fits[key] = dict(result)
+        if formula is not None:
+            self.fits[key]["formula"] = formula
+        self.fits.move_to_end(key)
+        while len(self.fits) > self.max_fits:
+            self.fits.popitem(last=False)
+
+    def items(self):
+        return self.fits.items()
+
+    def clear(self):
+        self.fits.clear()
+
+
+# Function to turn the numpy numbers in a fit result into something json can write, anything else is an
+# error, a project must not be saved with a value it can not load again
+def project_json_value(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError("Can not save {} in a project".format(type(value).__name__))
+
+
+# Function to save a project, the file is written next to the old one and then replaces it, so a
+# project is never left half written
+def save_project(file_path, project):
+    arrays = {}
+    manifest = {"version": PROJECT_VERSION, "datasets": [], "model": project.get("model"), "fits": {},
+                "last_fit": project.get("last_fit")}
+
+    for index, dataset in enumerate(project.get("datasets", [])):
+        arrays["data_{}_x".format(index)] = np.asarray(dataset["x"], dtype=float)
+        arrays["data_{}_y".format(index)] = np.asarray(dataset["y"], dtype=float)
+        manifest["datasets"].append({key: dataset.get(key, "") for key in ("name", "x_label", "y_label")})
+
+    # The covariance matrices are arrays, the rest of a fit result goes into the manifest
+    for index, (key, result) in enumerate(project.get("fits", FitCache()).items()):
+        result = dict(result)
+        pcov = result.pop("pcov", None)
+        if pcov is not None:
+            arrays["pcov_{}".format(index)] = np.asarray(pcov, dtype=float)
+            result["pcov"] = "pcov_{}".format(index)
+        manifest["fits"][key] = result
+
+    arrays["manifest"] = np.array(json.dumps(manifest, default=project_json_value))
+    temporary_path = file_path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        np.savez_compressed(file, **arrays)
+    os.replace(temporary_path, file_path)
+    return file_path
+
+
+# Function to open a project, it returns a project dictionary with the fit results in a FitCache
+def load_project(file_path, max_fits=MAX_FITS):
+    with np.load(file_path, allow_pickle=False) as arrays:
+        manifest = json.loads(str(arrays["manifest"]))
+        if manifest.get("version", 0) > PROJECT_VERSION:
+            raise ValueError("The project was saved by a newer version of the program")
+
+        datasets = []
+        for index, dataset in enumerate(manifest["datasets"]):
+            dataset = dict(dataset)
+            dataset["x"] = arrays["data_{}_x".format(index)]
+            dataset["y"] = arrays["data_{}_y".format(index)]
+            datasets.append(dataset)
+
+        fits = FitCache(max_fits)
+        for key, result in manifest["fits"].items():
+            if isinstance(result.get("pcov"), str):
+                result["pcov"] = arrays[result["pcov"]]
+            fits.put(key, result)
+
+    return {"datasets": datasets, "model": manifest.get("model"), "fits": fits, "last_fit": manifest.get("last_fit")}
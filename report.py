@@ -0,0 +1,314 @@
+import base64
+import hashlib
+import html
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from datastore import load_csv
+from diagnostics import stage
+from model_compiler import compile_model
+from plotting import decimate, adaptive_grid, draw_landscape
+
+# Builds html reports from fit results, one fit or a whole batch
+# A fit result is the dictionary returned by engine.fit, with the formula, the data (or the file it was
+# read from) and the axis labels added. The plots are drawn without a GUI by the Agg backend, in a pool
+# of worker processes for a batch, and every image is cached on disk under a hash of the data, the
+# model and the parameters, so making the report again only draws the plots of fits that changed.
+# The cache keeps the images that were used last, the oldest are deleted once there are CACHE_FILES.
+
+# The folder the rendered plots are cached in
+CACHE_DIR = ".report_cache"
+
+# The most images kept in the cache, about 50 kB each
+CACHE_FILES = 1000
+
+REPORT_STYLE = """
+        <style>
+            table, th, td {
+            border: 1px solid black;
+            border-collapse: collapse;
+            }
+            th, td {
+            padding: 15px;
+            }
+        </style>"""
+
+
+# Function to write the formula with the x-axis label in place of x
+def format_formula(formula, x_label=""):
+    formula = formula.replace("^", "**")
+    if x_label != "":
+        # Replace x only where it is not a part of another variable name
+        # For example, "a*x + b" becomes "a*<x-axis-label> + b", but "ax + b" is left alone
+        formula = re.sub(r"(?<![a-zA-Z])x(?![a-zA-Z])", x_label, formula)
+    return formula
+
+
+# Function to get the data of a fit result, from the result itself or from the file it was read from
+def result_data(result):
+    if "x" in result:
+        return np.asarray(result["x"], dtype=float), np.asarray(result["y"], dtype=float)
+    x, y, _, _ = load_csv(result["file"])
+    return x, y
+
+
+# Function to get the cache key of the plot of a fit result, a hash of the data, the model and the parameters
+def plot_key(result, x, y):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    digest.update(repr((result["formula"], list(result["param_names"]), [float(value) for value in result["params"]],
+                        result.get("x_label", ""), result.get("y_label", ""))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Function to draw the plot of a fit result as a png image, with the Agg backend and without pyplot
+def render_plot(result, x, y, dpi=150):
+    figure = Figure(figsize=(6.4, 4.8), dpi=dpi)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+
+    model = compile_model(result["formula"], result["param_names"])
+    x_fit, y_fit = adaptive_grid(lambda x_grid: model(x_grid, *result["params"]), np.min(x), np.max(x))
+    x_plot, y_plot = decimate(x, y)
+    ax.plot(x_fit, y_fit, 'r-', label='Fitted Curve')
+    ax.plot(x_plot, y_plot, 'bo', label='Data Points')
+    ax.set_xlabel(result.get("x_label", ""))
+    ax.set_ylabel(result.get("y_label", ""))
+    ax.legend()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+# Function to draw the map of the sum of squared errors of a fit as a png image
+def render_landscape(landscape, dpi=150):
+    figure = Figure(figsize=(6.4, 4.8), dpi=dpi)
+    FigureCanvasAgg(figure)
+    draw_landscape(figure, landscape)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+# Function to make the html of the map of the sum of squared errors, if the fit has one
+def landscape_section(landscape):
+    if not landscape:
+        return ""
+    image = base64.b64encode(render_landscape(landscape)).decode("utf-8")
+    return """
+            <h3>Sum of Squared Errors of {} and {}</h3>
+            <img src="data:image/png;base64,{}" />""".format(html.escape(landscape["param_names"][0]),
+                                                          html.escape(landscape["param_names"][1]), image)
+
+
+# Function to get the plot of a fit result as base64, from the cache if it was drawn before
+# It runs inside a worker process for a batch, the cache files are written atomically so the
+# workers can share the cache folder
+def render_cached(job):
+    result, cache_dir = job
+    if result.get("error"):
+        return None
+    x, y = result_data(result)
+    cache_path = os.path.join(cache_dir, plot_key(result, x, y) + ".png")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as file:
+            image = file.read()
+        # Mark the image as used, so it is kept when the cache is pruned
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+    else:
+        image = render_plot(result, x, y)
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        with open(temporary_path, "wb") as file:
+            file.write(image)
+        os.replace(temporary_path, cache_path)
+    return base64.b64encode(image).decode("utf-8")
+
+
+# Function to delete the images of the cache that were used longest ago, so it keeps at most keep images
+def prune_cache(cache_dir=CACHE_DIR, keep=CACHE_FILES):
+    try:
+        with os.scandir(cache_dir) as entries:
+            images = [(entry.stat().st_mtime, entry.path) for entry in entries if entry.name.endswith(".png")]
+    except OSError:
+        return
+    images.sort(reverse=True)
+    for _, path in images[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Function to get the plots of many fit results, drawn on a pool of worker processes if there is more than one
+def render_plots(results, cache_dir=CACHE_DIR, workers=None):
+    jobs = [(result, cache_dir) for result in results]
+    if len(jobs) <= 1 or workers == 1:
+        images = [render_cached(job) for job in jobs]
+    else:
+        workers = min(len(jobs), workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            images = list(executor.map(render_cached, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    prune_cache(cache_dir)
+    return images
+
+
+# Function to get the name of a fit result, the name of its file if it has one
+def result_name(result, index=0):
+    if result.get("name"):
+        return result["name"]
+    if result.get("file"):
+        return os.path.splitext(os.path.basename(result["file"]))[0]
+    return "Fit {}".format(index + 1)
+
+
+# Function to get a different name for every fit result, a number is added to names that repeat
+def unique_names(results):
+    names = []
+    for index, result in enumerate(results):
+        name = result_name(result, index)
+        if name in names:
+            name = "{} ({})".format(name, index + 1)
+        names.append(name)
+    return names
+
+
+# Function to make the html of one fit, the plot and the table of the formula and the statistics
+def result_section(result, image_base64, name, heading="h1"):
+    if result.get("error"):
+        return """
+            <{0}>{1}</{0}>
+            <p>Fitting failed: {2}</p>""".format(heading, html.escape(name), html.escape(result["error"]))
+
+    formula = format_formula(result["formula"], result.get("x_label", ""))
+    param_values = ", ".join("{} = {:.4f}".format(param_name, value) for param_name, value in zip(result["param_names"], result["params"]))
+    return """
+            <{heading} id="{anchor}">{name}</{heading}>
+            <img src="data:image/png;base64,{image}" />
+            <table>
+                <tr>
+                    <th>Formula</th>
+                    <td>{formula}</td>
+                </tr>
+                <tr>
+                    <th>R-squared</th>
+                    <td>{r_squared:.4f}</td>
+                </tr>
+                <tr>
+                    <th>Adjusted R-squared</th>
+                    <td>{adj_r_squared:.4f}</td>
+                </tr>
+                <tr>
+                    <th>p-value</th>
+                    <td>{p_value:.4f}</td>
+                </tr>
+                <tr>
+                    <th>Standard Error</th>
+                    <td>{std_err:.4f}</td>
+                </tr>
+                <tr>
+                    <th>Predicted Parameter Values</th>
+                    <td>{params}</td>
+                </tr>{intervals}
+            </table>{landscape}""".format(heading=heading, anchor=anchor_name(name), name=html.escape(name), image=image_base64,
+                               formula=html.escape(formula), r_squared=result["r_squared"], adj_r_squared=result["adj_r_squared"],
+                               p_value=result["p_value"], std_err=result["std_err"], params=html.escape(param_values),
+                               intervals=confidence_rows(result.get("bootstrap")),
+                               landscape=landscape_section(result.get("landscape")))
+
+
+# Function to make the table rows of the bootstrap confidence intervals, if the fit has them
+def confidence_rows(bootstrap):
+    if not bootstrap:
+        return ""
+    rows = ""
+    for name, low, high, std_err in zip(bootstrap["param_names"], bootstrap["lower"], bootstrap["upper"], bootstrap["std_err"]):
+        rows += """
+                <tr>
+                    <th>{:.0f}% Confidence Interval of {}</th>
+                    <td>[{:.4g}, {:.4g}], bootstrap standard error {:.4g}</td>
+                </tr>""".format(bootstrap["confidence"] * 100, html.escape(name), low, high, std_err)
+    return rows
+
+
+# Function to turn a name into something that can be used as an html anchor or a file name
+def anchor_name(name):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+# Function to make the table of contents of a batch, one row per fit with a link to its report
+def index_table(results, names, links):
+    rows = []
+    for result, name, link in zip(results, names, links):
+        if result.get("error"):
+            cells = '<td colspan="3">failed: {}</td>'.format(html.escape(result["error"]))
+        else:
+            cells = "<td>{:.4f}</td><td>{:.4f}</td><td>{}</td>".format(
+                result["r_squared"], result["adj_r_squared"],
+                html.escape(", ".join("{} = {:.4g}".format(n, v) for n, v in zip(result["param_names"], result["params"]))))
+        rows.append('<tr><td><a href="{}">{}</a></td>{}</tr>'.format(link, html.escape(name), cells))
+    return """
+            <table>
+                <tr><th>Data</th><th>R-squared</th><th>Adjusted R-squared</th><th>Predicted Parameter Values</th></tr>
+                {}
+            </table>""".format("\n                ".join(rows))
+
+
+def page(title, body):
+    return """
+    <html>
+        <head>{}
+            <title>{}</title>
+        </head>
+        <body>{}
+        </body>
+    </html>
+    """.format(REPORT_STYLE, html.escape(title), body)
+
+
+# Function to write one html report for one or more fit results
+# A single fit gives the same report as before, a batch starts with a table of contents
+# If a diagnostics record is passed, drawing the plots and writing the html are timed
+def write_report(results, file_path="report.html", cache_dir=CACHE_DIR, workers=None, record=None):
+    with stage(record, "plots"):
+        images = render_plots(results, cache_dir, workers)
+    with stage(record, "html"):
+        return write_report_html(results, images, file_path)
+
+
+# Function to write the html of a report, with the plots already drawn
+def write_report_html(results, images, file_path):
+    if len(results) == 1:
+        body = result_section(results[0], images[0], "Model Report")
+    else:
+        names = unique_names(results)
+        body = "\n            <h1>Model Report</h1>" + index_table(results, names, ["#" + anchor_name(name) for name in names])
+        body += "".join(result_section(result, image, name, "h2") for result, image, name in zip(results, images, names))
+    with open(file_path, "w", encoding="UTF-8") as file:
+        file.write(page("Model Report", body))
+    return file_path
+
+
+# Function to write a folder of reports, an index.html with a table of contents and one page per fit
+def write_report_set(results, directory, cache_dir=CACHE_DIR, workers=None):
+    os.makedirs(directory, exist_ok=True)
+    images = render_plots(results, cache_dir, workers)
+    names = unique_names(results)
+    links = [anchor_name(name) + ".html" for name in names]
+    for result, image, name, link in zip(results, images, names, links):
+        with open(os.path.join(directory, link), "w", encoding="UTF-8") as file:
+            file.write(page(name, result_section(result, image, name) + '\n            <p><a href="index.html">Back to the index</a></p>'))
+
+    index_path = os.path.join(directory, "index.html")
+    with open(index_path, "w", encoding="UTF-8") as file:
+        file.write(page("Model Report", "\n            <h1>Model Report</h1>" + index_table(results, names, links)))
+    return index_path
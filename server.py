@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import freeze_support
+import numpy as np
+from compare import list_model_files
+from diagnostics import json_safe
+from engine import read_model_file, fit_formula
+
+# A local fitting service, for scripts that want to fit without the GUI
+# It listens on localhost only and speaks json over http. The fits run on a pool of worker processes
+# that is started and warmed up once, with a small fit in every worker, so a request does not pay for
+# starting python and importing numpy and scipy. The compiled formulas are cached in every worker,
+# so fitting the same formula again does not parse it again.
+#
+#   POST /fit      one fit, or {"fits": [...]} for a batch, see fit_request for the fields of a fit
+#   GET  /models   the models in the models folder, with their formulas and starting parameters
+#   GET  /stats    the number of fits so far and the fits per second over the last minute
+# Example:
+#   python server.py --port 8765
+#   curl -d '{"model": "Langmuir", "x": [1, 2, 5, 10], "y": [1.2, 2.3, 5.4, 9.8]}' http://127.0.0.1:8765/fit
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+# The largest request body that is read, in bytes
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+# The fits per second are counted over this many seconds
+STATS_WINDOW = 60.0
+
+
+# Function to read the model files once, as {name: (formula, param_names, params)}
+def load_models(model_files=None):
+    models = {}
+    for model_path in model_files if model_files is not None else list_model_files():
+        try:
+            models[os.path.splitext(os.path.basename(model_path))[0]] = read_model_file(model_path)
+        except Exception:
+            continue
+    return models
+
+
+# The models are sent once to every worker process when it starts, not with every fit
+_worker = {}
+
+
+def _init_worker(models):
+    _worker["models"] = models
+
+
+# Function to make a worker do a small fit, so numpy, scipy and the fitting code are all loaded
+def _warm_up(_):
+    fit_formula("a*x + b", ["a", "b"], [1.0, 0.0], np.array([0.0, 1.0, 2.0]), np.array([0.1, 1.1, 1.9]))
+    return os.getpid()
+
+
+# Function to do one fit of a request, it runs inside a worker process
+# A fit has x, y and either a formula with param_names or the name of a model from the models folder,
+# params are the starting values, by default those of the model file. id is sent back with the result.
+# Errors are returned with the result, so one bad fit does not stop the rest of a batch.
+def fit_request(request):
+    start = time.perf_counter()
+    result = {"error": ""}
+    try:
+        if not isinstance(request, dict):
+            raise ValueError("A fit has to be a json object")
+        if "id" in request:
+            result["id"] = request["id"]
+        if request.get("model") is not None:
+            if request["model"] not in _worker["models"]:
+                raise ValueError("Unknown model: {}".format(request["model"]))
+            formula, param_names, params = _worker["models"][request["model"]]
+            result["model"] = request["model"]
+        else:
+            if "formula" not in request or "param_names" not in request:
+                raise ValueError("A fit needs a model, or a formula and param_names")
+            formula, param_names, params = request["formula"], list(request["param_names"]), None
+        params = request.get("params", params)
+        if params is None or len(params) != len(param_names):
+            raise ValueError("A fit needs a starting value for each of {}".format(", ".join(param_names)))
+
+        x = np.asarray(request.get("x", []), dtype=float)
+        y = np.asarray(request.get("y", []), dtype=float)
+        if x.ndim != 1 or x.shape != y.shape:
+            raise ValueError("x and y have to be lists of numbers of the same length")
+        fitted = fit_formula(formula, param_names, [float(value) for value in params], x, y)
+        fitted.pop("pcov")
+        result["formula"] = formula
+        result.update(fitted)
+    except Exception as e:
+        result["error"] = str(e)
+    result["time"] = time.perf_counter() - start
+    return result
+
+
+# The number of fits the service did, and how many of them in the last STATS_WINDOW seconds
+class ServiceStats:
+    def __init__(self, window=STATS_WINDOW):
+        self.window = window
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.fits = 0
+        self.errors = 0
+        self.fit_time = 0.0
+        self.recent = deque()
+
+    def add(self, results):
+        now = time.time()
+        with self.lock:
+            self.requests += 1
+            self.fits += len(results)
+            self.errors += sum(1 for result in results if result["error"])
+            self.fit_time += sum(result["time"] for result in results)
+            self.recent.append((now, len(results)))
+            while self.recent and self.recent[0][0] < now - self.window:
+                self.recent.popleft()
+
+    def to_dict(self):
+        now = time.time()
+        with self.lock:
+            recent = sum(count for finished, count in self.recent if finished >= now - self.window)
+            return {
+                "uptime": now - self.started,
+                "requests": self.requests,
+                "fits": self.fits,
+                "errors": self.errors,
+                "fits_per_second": recent / max(1e-9, min(self.window, now - self.started)),
+                "mean_fit_time": self.fit_time / self.fits if self.fits else 0.0,
+            }
+
+
+# The worker pool, the models and the statistics of a running service
+class FitService:
+    def __init__(self, workers=None, model_files=None):
+        self.models = load_models(model_files)
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.models,))
+        self.stats = ServiceStats()
+
+    # Function to start every worker process and wait until it has done a fit
+    def warm_up(self):
+        wait([self.executor.submit(_warm_up, index) for index in range(self.workers)])
+
+    # Function to do a batch of fits on the pool, the fits are handed out in chunks to keep the overhead low
+    def fit(self, requests):
+        chunksize = max(1, len(requests) // (self.workers * 4))
+        results = list(self.executor.map(fit_request, requests, chunksize=chunksize))
+        self.stats.add(results)
+        return results
+
+    def model_list(self):
+        return [{"name": name, "formula": formula, "param_names": param_names, "params": params}
+                for name, (formula, param_names, params) in self.models.items()]
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class FitRequestHandler(BaseHTTPRequestHandler):
+    server_version = "NLInteractive"
+
+    def send_json(self, value, status=200):
+        body = json.dumps(json_safe(value), allow_nan=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/models":
+            self.send_json({"models": service.model_list()})
+        elif self.path == "/stats":
+            self.send_json(dict(service.stats.to_dict(), workers=service.workers))
+        else:
+            self.send_json({"error": "Not found: {}".format(self.path)}, 404)
+
+    # A single fit is answered with its result, a batch {"fits": [...]} with {"results": [...]} and the
+    # time the batch took
+    def do_POST(self):
+        if self.path != "/fit":
+            self.send_json({"error": "Not found: {}".format(self.path)}, 404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                self.send_json({"error": "Invalid Content-Length: {}".format(length)}, 400)
+                return
+            if length > MAX_REQUEST_BYTES:
+                self.send_json({"error": "The request is larger than {} bytes".format(MAX_REQUEST_BYTES)}, 413)
+                return
+            request = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self.send_json({"error": "The request is not valid json: {}".format(str(e))}, 400)
+            return
+
+        start = time.perf_counter()
+        if isinstance(request, dict) and "fits" in request:
+            if not isinstance(request["fits"], list):
+                self.send_json({"error": "fits has to be a list"}, 400)
+                return
+            results = self.server.service.fit(request["fits"]) if request["fits"] else []
+            elapsed = time.perf_counter() - start
+            self.send_json({"results": results, "time": elapsed,
+                            "fits_per_second": len(results) / elapsed if elapsed > 0 else 0.0})
+        else:
+            self.send_json(self.server.service.fit([request])[0])
+
+    # The requests are counted in the statistics, they are not logged one by one
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to start the service, it warms up the workers and then answers requests until it is stopped
+def serve(host=HOST, port=PORT, workers=None, model_files=None, ready=None):
+    service = FitService(workers, model_files)
+    try:
+        service.warm_up()
+        server = ThreadingHTTPServer((host, port), FitRequestHandler)
+        server.daemon_threads = True
+        server.service = service
+        if ready is not None:
+            ready(server)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local json fitting service on a pool of worker processes")
+    parser.add_argument("--host", default=HOST, help="address to listen on, localhost by default")
+    parser.add_argument("-p", "--port", type=int, default=PORT, help="port to listen on")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    def ready(server):
+        host, port = server.server_address[:2]
+        print("Fitting service with {} workers on http://{}:{}".format(server.service.workers, host, port))
+
+    try:
+        serve(args.host, args.port, args.workers, ready=ready)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    freeze_support()
+    main()
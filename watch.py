@@ -0,0 +1,225 @@
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import freeze_support
+from batch import fit_file
+from engine import read_model_file
+
+# Command line tool to watch a folder and fit every new or changed data file, with no one at the GUI
+# The folder is scanned every few seconds. A file is fitted when it is new, or when its modification
+# time or size changed and its content hash is different from the last time it was fitted, so files
+# that were only touched or copied again are not fitted twice. The fits run on a pool of worker
+# processes that is started once, and every result is appended to a results table in a SQLite
+# database, together with the hash of the file it came from. Every file is read for its hash once, the
+# modification time and size taken before hashing it are checked again after the fit, and a result is
+# only stored when the file was not written to since it was hashed. The database also
+# remembers which files were fitted with which formula and starting parameters, so the watch can be
+# stopped and started again without fitting everything again, and changing the model fits every file
+# with the new one.
+# Example:
+#   python watch.py models/Langmuir.txt incoming --database results.sqlite
+
+# The seconds between two scans of the folder
+INTERVAL = 5.0
+
+# A file is only fitted when it has not been modified for this many seconds, so a file that is still
+# being written by the instrument is not read half way
+SETTLE = 2.0
+
+# The number of bytes read at once to hash a file
+HASH_CHUNK = 1024 * 1024
+
+STATISTICS = ["r_squared", "adj_r_squared", "std_err", "p_value", "sse", "rmse", "aic", "bic", "n"]
+
+
+# Function to open the results database, the tables are created the first time
+# The database is in write-ahead log mode, so it can be read while the watch is writing to it
+def open_database(file_path):
+    connection = sqlite3.connect(file_path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # Databases from before the starting parameters were part of the key only forget which files were
+    # processed, their results are kept and the files are fitted once more
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(processed)")]
+    if columns and "start" not in columns:
+        with connection:
+            connection.execute("DROP TABLE processed")
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS processed (
+            path TEXT NOT NULL,
+            formula TEXT NOT NULL,
+            start TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (path, formula, start)
+        );
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            model TEXT NOT NULL,
+            formula TEXT NOT NULL,
+            fitted_at REAL NOT NULL,
+            error TEXT NOT NULL,
+            r_squared REAL, adj_r_squared REAL, std_err REAL, p_value REAL,
+            sse REAL, rmse REAL, aic REAL, bic REAL, n INTEGER,
+            param_names TEXT, params TEXT, param_std_err TEXT
+        );
+        CREATE INDEX IF NOT EXISTS results_path ON results (path);
+    """)
+    return connection
+
+
+# Function to get the sha256 hash of a file, read in chunks so big files do not have to fit in memory
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to get the key of the starting parameters of a model, files are fitted again when they change
+def start_key(param_names, params):
+    return json.dumps([list(param_names), [float(value) for value in params]])
+
+
+# Function to find the files of the folder that have to be fitted, as a list of (path, mtime_ns, size, sha256)
+# Files whose modification time and size did not change are skipped without reading them. Files that
+# changed but have the same hash are only marked with the new time, they are not fitted again.
+def scan_folder(folder, pattern, connection, formula, start, settle=SETTLE):
+    known = {path: (mtime_ns, size, sha256) for path, mtime_ns, size, sha256 in connection.execute(
+        "SELECT path, mtime_ns, size, sha256 FROM processed WHERE formula = ? AND start = ?", (formula, start))}
+    now_ns = time.time_ns()
+    changed = []
+    touched = []
+    with os.scandir(folder) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if not entry.is_file() or not fnmatch.fnmatch(entry.name, pattern):
+                continue
+            try:
+                status = entry.stat()
+            except OSError:
+                continue
+            if now_ns - status.st_mtime_ns < settle * 1e9:
+                continue
+            path = os.path.abspath(entry.path)
+            old = known.get(path)
+            if old is not None and old[:2] == (status.st_mtime_ns, status.st_size):
+                continue
+            try:
+                sha256 = file_hash(path)
+            except OSError:
+                continue
+            if old is not None and old[2] == sha256:
+                touched.append((status.st_mtime_ns, status.st_size, path, formula, start))
+                continue
+            changed.append((path, status.st_mtime_ns, status.st_size, sha256))
+
+    if touched:
+        with connection:
+            connection.executemany("UPDATE processed SET mtime_ns = ?, size = ? WHERE path = ? AND formula = ? AND start = ?",
+                                   touched)
+    return changed
+
+
+# Function to keep the files and results of a scan whose file still has the modification time and size
+# it had before it was hashed, so the hash is the hash of the data that was fitted without reading the
+# file again. A file written to after it was found is left for the next scan
+def unchanged_results(files, results):
+    kept = []
+    for file, result in zip(files, results):
+        try:
+            status = os.stat(file[0])
+        except OSError:
+            continue
+        if (status.st_mtime_ns, status.st_size) == file[1:3]:
+            kept.append((file, result))
+    return [file for file, _ in kept], [result for _, result in kept]
+
+
+# Function to append the results of a scan to the database and mark their files as processed
+# Everything is written in one transaction, so a file is never marked without its result
+def store_results(connection, model_name, formula, start, files, results):
+    fitted_at = time.time()
+    rows = []
+    for (path, _, _, sha256), result in zip(files, results):
+        rows.append([path, sha256, model_name, formula, fitted_at, result["error"]] +
+                    [result.get(name) for name in STATISTICS] +
+                    [json.dumps(result[name]) if name in result else None for name in ("param_names", "params", "param_std_err")])
+    with connection:
+        connection.executemany("INSERT INTO results (path, sha256, model, formula, fitted_at, error, {}, param_names, params, "
+                               "param_std_err) VALUES ({})".format(", ".join(STATISTICS), ", ".join("?" * (len(STATISTICS) + 9))), rows)
+        connection.executemany("INSERT OR REPLACE INTO processed (path, formula, start, mtime_ns, size, sha256) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               [(path, formula, start, mtime_ns, size, sha256) for path, mtime_ns, size, sha256 in files])
+
+
+# Function to watch a folder and fit every new or changed file matching the pattern
+# once stops after one scan. callback is called with the files and the results of every scan that
+# fitted something, to print them or to stop the watch by raising.
+def watch(model_path, folder, database="results.sqlite", pattern="*.csv", interval=INTERVAL, workers=None,
+          once=False, settle=SETTLE, callback=None):
+    formula, param_names, params = read_model_file(model_path)
+    model_name = os.path.splitext(os.path.basename(model_path))[0]
+    start_params = start_key(param_names, params)
+    connection = open_database(database)
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            start = time.perf_counter()
+            files = scan_folder(folder, pattern, connection, formula, start_params, settle)
+            if files:
+                jobs = [(formula, param_names, params, path) for path, _, _, _ in files]
+                chunksize = max(1, len(jobs) // (workers * 4))
+                results = list(executor.map(fit_file, jobs, chunksize=chunksize))
+                files, results = unchanged_results(files, results)
+                store_results(connection, model_name, formula, start_params, files, results)
+                if files and callback is not None:
+                    callback(files, results, time.perf_counter() - start)
+            if once:
+                return
+            time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch a folder and fit every new or changed data file into a SQLite database")
+    parser.add_argument("model", help="model file, for example models/Langmuir.txt")
+    parser.add_argument("folder", help="folder to watch")
+    parser.add_argument("-d", "--database", default="results.sqlite", help="SQLite database the results are appended to")
+    parser.add_argument("--pattern", default="*.csv", help="file name pattern of the data files")
+    parser.add_argument("-i", "--interval", type=float, default=INTERVAL, help="seconds between two scans of the folder")
+    parser.add_argument("--settle", type=float, default=SETTLE, help="seconds a file has to be unchanged before it is fitted")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--once", action="store_true", help="scan the folder once and stop")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.folder):
+        parser.error("not a folder: {}".format(args.folder))
+
+    def report(files, results, seconds):
+        failed = sum(1 for result in results if result["error"])
+        print("Fitted {} files, {} failed, in {:.2f} s".format(len(results) - failed, failed, seconds))
+        for result in results:
+            if result["error"]:
+                print("  {}: {}".format(result["file"], result["error"]))
+
+    print("Watching {} for {}, results in {}".format(args.folder, args.pattern, args.database))
+    try:
+        watch(args.model, args.folder, args.database, args.pattern, args.interval, args.workers, args.once,
+              args.settle, report)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    freeze_support()
+    main()
@@ -0,0 +1,151 @@
+import itertools
+import queue
+import threading
+import time
+
+# Runs fitting jobs on a background thread, so the GUI stays responsive while curve_fit is working
+# Jobs are queued and run one after the other. The worker never touches the GUI, it puts messages
+# on a queue and the GUI polls it with root.after and runs the callbacks of the job on its own thread.
+
+
+# Raised inside a job when it is cancelled, it stops the optimizer at its next model evaluation
+class FitCancelled(Exception):
+    pass
+
+
+# Passed to every job, it counts the model and jacobian evaluations, reports them as progress and
+# raises FitCancelled when the job has been cancelled
+class Progress:
+    # The shortest time between two progress messages, in seconds
+    INTERVAL = 0.1
+
+    def __init__(self, job, messages):
+        self.job = job
+        self.messages = messages
+        self.nfev = 0
+        self.njev = 0
+        self.info = {}
+        self.last_report = 0.0
+
+    # Function to stop the job if it has been cancelled, and to send progress now and then
+    def check(self):
+        if self.job.cancelled.is_set():
+            raise FitCancelled()
+        now = time.perf_counter()
+        if now - self.last_report >= self.INTERVAL:
+            self.last_report = now
+            self.messages.put(("progress", self.job, self.snapshot()))
+
+    # Function to add information to the progress, for example the round of a brute force search
+    def report(self, **info):
+        self.info.update(info)
+        self.check()
+
+    def snapshot(self):
+        snapshot = {"nfev": self.nfev, "njev": self.njev}
+        snapshot.update(self.info)
+        return snapshot
+
+    # Function to wrap a model, so every evaluation is counted and can be cancelled
+    def wrap_model(self, model):
+        def counted_model(x, *params):
+            self.nfev += 1
+            self.check()
+            return model(x, *params)
+        return counted_model
+
+    # Function to wrap a jacobian, with the analytic jacobian there is one evaluation per iteration
+    def wrap_jac(self, jac):
+        if jac is None or isinstance(jac, str):
+            return jac
+
+        def counted_jac(x, *params):
+            self.njev += 1
+            self.check()
+            return jac(x, *params)
+        return counted_jac
+
+
+class FitJob:
+    def __init__(self, job_id, name, function, on_done=None, on_error=None):
+        self.job_id = job_id
+        self.name = name
+        self.function = function
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = threading.Event()
+
+
+class FitWorker:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.messages = queue.Queue()
+        self.current = None
+        self.pending = []
+        self.ids = itertools.count(1)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # Function to add a job to the queue, function is called with a Progress and returns the result
+    # on_done is called with the result and on_error with the exception, both on the thread that polls
+    def submit(self, name, function, on_done=None, on_error=None):
+        job = FitJob(next(self.ids), name, function, on_done, on_error)
+        self.pending.append(job)
+        self.jobs.put(job)
+        return job
+
+    # Function to cancel one job, or the running job and every job that is still waiting
+    def cancel(self, job=None):
+        if job is not None:
+            job.cancelled.set()
+            return
+        for queued in list(self.pending):
+            queued.cancelled.set()
+        if self.current is not None:
+            self.current.cancelled.set()
+
+    # Function to check if the worker has nothing to do
+    def idle(self):
+        return self.current is None and not self.pending
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            self.current = job
+            if job in self.pending:
+                self.pending.remove(job)
+            if job.cancelled.is_set():
+                self.current = None
+                self.messages.put(("cancelled", job, None))
+                continue
+            self.messages.put(("started", job, None))
+            progress = Progress(job, self.messages)
+            try:
+                result = job.function(progress)
+            except FitCancelled:
+                self.messages.put(("cancelled", job, None))
+            except Exception as e:
+                self.messages.put(("error", job, e))
+            else:
+                # A job that can not be stopped half way is still dropped if it was cancelled
+                if job.cancelled.is_set():
+                    self.messages.put(("cancelled", job, None))
+                else:
+                    self.messages.put(("done", job, result))
+            finally:
+                self.current = None
+
+    # Function to handle the messages of the worker, it must be called from the GUI thread
+    # Every message is passed to on_message as (kind, job, value), then the callbacks of the job are run
+    def poll(self, on_message=None):
+        while True:
+            try:
+                kind, job, value = self.messages.get_nowait()
+            except queue.Empty:
+                return
+            if on_message is not None:
+                on_message(kind, job, value)
+            if kind == "done" and job.on_done is not None:
+                job.on_done(value)
+            elif kind == "error" and job.on_error is not None:
+                job.on_error(value)